@@ -0,0 +1,111 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+TAG_VERSION_KEY = 'tag_version:{}'
+
+
+def make_tag(*parts):
+    return ':'.join(str(part) for part in parts)
+
+
+def tag_versions(*tags):
+    """Текущие версии тегов.
+
+    Версия - время последнего сброса в наносекундах, поэтому тег,
+    вытесненный из кэша, получает новую версию и не совпадает
+    ни с одним старым ключом фрагмента.
+    """
+    keys = {TAG_VERSION_KEY.format(tag): tag for tag in tags}
+    versions = {keys[key]: version
+                for key, version in cache.get_many(list(keys)).items()}
+    missing = [tag for tag in tags if tag not in versions]
+    if missing:
+        versions.update(bump_tags(*missing))
+    return versions
+
+
+def tags_version(*tags):
+    versions = tag_versions(*tags)
+    return '.'.join(str(versions[tag]) for tag in tags)
+
+
+def bump_tags(*tags):
+    version = time.time_ns()
+    versions = dict.fromkeys(tags, version)
+    cache.set_many(
+        {TAG_VERSION_KEY.format(tag): version for tag in tags},
+        None
+    )
+    return versions
+
+
+def set_surrogate_keys(response, *tags):
+    """Помечает ответ тегами, по которым сбрасывается кэш страницы."""
+    response['Surrogate-Key'] = ' '.join(tags)
+    return response
+
+
+def get_surrogate_keys(response):
+    return response.get('Surrogate-Key', '').split()
+
+
+def page_validators(request, versions):
+    """ETag и Last-Modified страницы по версиям её тегов.
+
+    В ETag входят пользователь и его CSRF-cookie: разметка страницы
+    зависит от них, поэтому 304 для другого зрителя недопустим.
+    """
+    user_id = request.user.pk if request.user.is_authenticated else ''
+    raw = '|'.join([
+        request.get_full_path(),
+        str(user_id),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, '') if user_id else '',
+        *(f'{tag}={version}' for tag, version in sorted(versions.items())),
+    ])
+    etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+    last_modified = max(versions.values()) // 10 ** 9
+    return etag, last_modified
+
+
+def tagged_page(tags_func):
+    """Декоратор страницы, собранной из объектов с тегами.
+
+    tags_func получает аргументы представления и возвращает теги
+    страницы (или пустой список, если объекта нет). Декоратор отвечает
+    304 Not Modified без вызова представления, пока версии тегов
+    не изменились, и помечает ответ заголовками ETag, Last-Modified
+    и Surrogate-Key.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            tags = tags_func(*args, **kwargs)
+            if not tags or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = tag_versions(*tags)
+            request.tag_versions = versions
+            etag, last_modified = page_validators(request, versions)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                # CsrfViewMiddleware выдаст новую cookie уже после
+                # представления, и ETag, вычисленный без неё, со следующим
+                # запросом не совпадёт: валидаторы появятся с ним.
+                issues_csrf_cookie = (
+                    request.META.get('CSRF_COOKIE_USED')
+                    and settings.CSRF_COOKIE_NAME not in request.COOKIES
+                )
+                if response.status_code == 200 and not issues_csrf_cookie:
+                    response['ETag'] = etag
+                    response['Last-Modified'] = http_date(last_modified)
+            return set_surrogate_keys(response, *tags)
+        return wrapper
+    return decorator
@@ -0,0 +1,10 @@
+from .settings import FEED_CACHE_TIMEOUT
+
+
+def feed_cache(request):
+    """
+    Добавляет время жизни кэшированных фрагментов лент.
+    """
+    return {
+        'feed_cache_timeout': FEED_CACHE_TIMEOUT,
+    }
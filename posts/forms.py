@@ -1,6 +1,9 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from .images import ImageTooLarge, UnsupportedImage, ingest_image
 from .models import Comment, Post
+from .settings import POST_IMAGE_MAX_PIXELS
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +11,24 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image',)
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return ingest_image(image)
+        except ImageTooLarge:
+            raise forms.ValidationError(
+                'Изображение больше %(limit)d мегапикселей.',
+                code='image_too_large',
+                params={'limit': POST_IMAGE_MAX_PIXELS // 10 ** 6}
+            )
+        except UnsupportedImage:
+            raise forms.ValidationError(
+                'Загрузите изображение в формате JPEG, PNG, GIF или WebP.',
+                code='unsupported_image'
+            )
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
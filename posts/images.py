@@ -0,0 +1,124 @@
+import base64
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageFilter, ImageOps, ImageSequence
+
+from .settings import (
+    POST_IMAGE_MAX_PIXELS, POST_IMAGE_MAX_SIDE, POST_IMAGE_QUALITY,
+    POST_PLACEHOLDER_QUALITY, POST_PLACEHOLDER_SIZE
+)
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': POST_IMAGE_QUALITY, 'optimize': True,
+             'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': POST_IMAGE_QUALITY},
+}
+KEPT_INFO = ('transparency',)
+# Принимаемые форматы: остальные Pillow открывает, но декодирует
+# внешними программами (EPS) или хуже
+ACCEPTED_FORMATS = ('JPEG', 'MPO', 'PNG', 'GIF', 'WEBP')
+# Форматы, в которых бывает анимация; MPO - это JPEG с дополнительными
+# кадрами (превью, стереопара), от него сохраняется первый кадр
+ANIMATED_FORMATS = ('GIF', 'PNG', 'WEBP')
+FORMAT_ALIASES = {'MPO': 'JPEG'}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+def save_animation(image, image_format, output, icc_profile):
+    """Перекодирует все кадры анимации без метаданных, сохраняя
+    длительности кадров и число повторов.
+    """
+    durations = []
+    for frame in ImageSequence.Iterator(image):
+        # WebP заполняет длительность кадра только при декодировании
+        frame.load()
+        durations.append(frame.info.get('duration', 0))
+    image.seek(0)
+    options = dict(SAVE_OPTIONS.get(image_format, {}))
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    image.save(output, format=image_format, save_all=True,
+               duration=durations, loop=image.info.get('loop', 0),
+               **options)
+
+
+def ingest_image(upload):
+    """Приводит загруженное изображение к виду для хранения.
+
+    Принимаются только ACCEPTED_FORMATS. Размер проверяется по заголовку
+    до декодирования, JPEG декодируется сразу в уменьшенном масштабе,
+    поэтому память на загрузку ограничена POST_IMAGE_MAX_PIXELS.
+    Затем изображение поворачивается по EXIF, уменьшается
+    до POST_IMAGE_MAX_SIDE и перекодируется в исходный формат без
+    метаданных во временный файл, который уходит на диск, как только
+    превышает FILE_UPLOAD_MAX_MEMORY_SIZE. Анимированные GIF, PNG и WebP
+    перекодируются покадрово без метаданных, но не уменьшаются;
+    предел пикселей для них считается по всем кадрам. От MPO остаётся
+    первый кадр в JPEG.
+    """
+    upload.seek(0)
+    output = SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    try:
+        with Image.open(upload) as image:
+            if image.format not in ACCEPTED_FORMATS:
+                raise UnsupportedImage(image.format)
+            image_format = FORMAT_ALIASES.get(image.format, image.format)
+            animated = image_format in ANIMATED_FORMATS and getattr(
+                image, 'is_animated', False
+            )
+            frames = image.n_frames if animated else 1
+            width, height = image.size
+            if width * height * frames > POST_IMAGE_MAX_PIXELS:
+                raise ImageTooLarge(width, height)
+            icc_profile = image.info.get('icc_profile')
+            if animated:
+                save_animation(image, image_format, output, icc_profile)
+            else:
+                image.draft(image.mode,
+                            (POST_IMAGE_MAX_SIDE, POST_IMAGE_MAX_SIDE))
+                image = ImageOps.exif_transpose(image)
+        if not animated:
+            image.thumbnail((POST_IMAGE_MAX_SIDE, POST_IMAGE_MAX_SIDE))
+    except OSError as error:
+        # Повреждённый файл или декодер, которого нет на сервере
+        raise UnsupportedImage(str(error)) from error
+    if not animated:
+        image.info = {key: value for key, value in image.info.items()
+                      if key in KEPT_INFO}
+        options = dict(SAVE_OPTIONS.get(image_format, {}))
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        image.save(output, format=image_format, **options)
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, upload.name, upload.content_type, size, upload.charset
+    )
+
+
+def make_placeholder(file_):
+    """Размытое превью изображения на несколько сотен байт
+    в виде data URI для встраивания в разметку.
+    """
+    with Image.open(file_) as image:
+        image.draft('RGB', POST_PLACEHOLDER_SIZE)
+        image = image.convert('RGB')
+    image.thumbnail(POST_PLACEHOLDER_SIZE)
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=POST_PLACEHOLDER_QUALITY)
+    encoded = base64.b64encode(output.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
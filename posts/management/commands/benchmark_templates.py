@@ -0,0 +1,96 @@
+import time
+
+from django import template
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context, Engine, engines
+
+from posts.models import Post
+from posts.settings import FEED_CACHE_TIMEOUT, POSTS_PER_PAGE_NUMBER
+from posts.thumbnails import prefetch_thumbnails
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+INCLUDE_LOOP = (
+    '{% for post in posts %}'
+    '{% include "post_item.html" with post=post %}'
+    '{% endfor %}'
+)
+RENDER_POSTS = '{% load posts_feed %}{% render_posts posts %}'
+
+# Библиотека cache движков замера: {% cache %} просто отрисовывает
+# содержимое, поэтому измеряется сама отрисовка, а не кэш фрагментов
+register = template.Library()
+
+
+class NoCacheNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        return self.nodelist.render(context)
+
+
+@register.tag('cache')
+def no_cache(parser, token):
+    nodelist = parser.parse(('endcache',))
+    parser.delete_first_token()
+    return NoCacheNode(nodelist)
+
+
+def make_engine(loaders):
+    engine = engines['django'].engine
+    return Engine(
+        dirs=engine.dirs,
+        loaders=loaders,
+        libraries={**engine.libraries, 'cache': __name__},
+        builtins=engine.builtins,
+        debug=False,
+    )
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время отрисовки поста в ленте: {% include %} '
+            'в цикле без кэша шаблонов и {% render_posts %} '
+            'с кэширующим загрузчиком.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=POSTS_PER_PAGE_NUMBER,
+            help='Сколько постов отрисовывать за проход.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Число проходов; берётся лучший.'
+        )
+
+    def measure(self, engine, source, context, repeat):
+        template = engine.from_string(source)
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            template.render(Context(context))
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        posts = list(Post.objects.for_feed()[:options['posts']])
+        if not posts:
+            raise CommandError('Нет постов для отрисовки.')
+        prefetch_thumbnails(posts)
+        context = {'posts': posts, 'feed_cache_timeout': FEED_CACHE_TIMEOUT}
+        cached_loaders = [('django.template.loaders.cached.Loader', LOADERS)]
+        before = self.measure(
+            make_engine(LOADERS), INCLUDE_LOOP, context, options['repeat']
+        )
+        after = self.measure(
+            make_engine(cached_loaders), RENDER_POSTS, context,
+            options['repeat']
+        )
+        for label, elapsed in (('include', before), ('render_posts', after)):
+            self.stdout.write('{}: {:.1f} мкс на пост'.format(
+                label, elapsed / len(posts) * 10 ** 6
+            ))
+        self.stdout.write('Ускорение: {:.2f}x'.format(before / after))
@@ -0,0 +1,113 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from posts.models import Post
+from posts.resize import remove_variant, resized_root, variant_files
+from posts.thumbnails import get_raw_many
+from posts.utils import chunked
+
+
+def walk_files(storage, directory, cutoff):
+    """Имена файлов каталога storage старше cutoff, без чтения
+    всего дерева в память.
+    """
+    root = storage.path('')
+    for path, dirs, files in os.walk(storage.path(directory)):
+        dirs.sort()
+        for filename in sorted(files):
+            full_path = os.path.join(path, filename)
+            if os.path.getmtime(full_path) < cutoff:
+                yield os.path.relpath(full_path, root).replace(os.sep, '/')
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения постов, на которые не ссылается ни один '
+            'пост, их варианты resized_image и миниатюры, которых нет '
+            'в хранилище ключей sorl.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько файлов сверять с базой за один запрос.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help=('Не трогать файлы моложе стольких секунд: они могут '
+                  'принадлежать незавершённой загрузке.')
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.'
+        )
+
+    def handle(self, *args, chunk_size, min_age, dry_run, **options):
+        self.dry_run = dry_run
+        cutoff = time.time() - min_age
+        storage = Post._meta.get_field('image').storage
+        images = 0
+        upload_to = Post._meta.get_field('image').upload_to
+        for names in chunked(walk_files(storage, upload_to, cutoff),
+                             chunk_size):
+            referenced = set(Post.objects.filter(
+                image__in=names
+            ).values_list('image', flat=True))
+            for name in names:
+                if name not in referenced:
+                    images += 1
+                    self.remove_image(storage, name)
+        thumbnails = 0
+        for names in chunked(walk_files(
+            default.storage, thumbnail_settings.THUMBNAIL_PREFIX, cutoff
+        ), chunk_size):
+            keys = {
+                add_prefix(ImageFile(name, default.storage).key): name
+                for name in names
+            }
+            for key, value in get_raw_many(list(keys)).items():
+                if value is None:
+                    thumbnails += 1
+                    self.remove_thumbnail(keys[key])
+        variants = 0
+        for chunk in chunked(
+            ((path, source) for path, source in variant_files()
+             if os.path.getmtime(path) < cutoff),
+            chunk_size
+        ):
+            referenced = set(Post.objects.filter(
+                image__in={source for path, source in chunk}
+            ).values_list('image', flat=True))
+            for path, source in chunk:
+                if source not in referenced:
+                    variants += 1
+                    self.remove_variant(path)
+        action = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(
+            f'{action} изображений: {images}, миниатюр: {thumbnails}, '
+            f'вариантов: {variants}'
+        )
+
+    def remove_image(self, storage, name):
+        if self.dry_run:
+            self.stdout.write(name)
+            return
+        source = ImageFile(name, storage)
+        default.kvstore.delete(source)
+        storage.delete(name)
+
+    def remove_thumbnail(self, name):
+        if self.dry_run:
+            self.stdout.write(name)
+            return
+        default.storage.delete(name)
+
+    def remove_variant(self, path):
+        if self.dry_run:
+            self.stdout.write(os.path.relpath(path, resized_root()))
+            return
+        remove_variant(path)
@@ -0,0 +1,158 @@
+import json
+import os
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.cache import bump_tags
+from posts.models import Post
+from posts.resize import LOCKS_DIR, remove_variant, resized_root
+from posts.settings import THUMBNAIL_CACHE_MAX_SIZE
+from posts.signals import posts_tags
+from posts.thumbnails import get_raw_many
+from posts.utils import chunked
+
+# После вытеснения каталог занимает не больше этой доли предела,
+# чтобы команда не срабатывала на каждом новом файле
+LOW_WATER = 0.9
+# Точность LRU: файлы с последним обращением в пределах часа
+# вытесняются вместе
+BUCKET_SECONDS = 60 * 60
+EVICT_CHUNK_SIZE = 5000
+
+
+def cached_files():
+    """Файлы миниатюр sorl и вариантов resized_image: полный путь,
+    час последнего обращения и размер.
+
+    Время обращения - большее из atime и mtime: при relatime atime
+    обновляется не чаще раза в сутки, а при noatime не обновляется.
+    """
+    for directory in (
+        default.storage.path(thumbnail_settings.THUMBNAIL_PREFIX),
+        resized_root(),
+    ):
+        for path, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if name != LOCKS_DIR]
+            for filename in files:
+                full_path = os.path.join(path, filename)
+                stat = os.stat(full_path)
+                yield (
+                    full_path,
+                    int(max(stat.st_atime, stat.st_mtime)) // BUCKET_SECONDS,
+                    stat.st_size,
+                )
+
+
+def thumbnail_sources():
+    """Исходные изображения миниатюр по спискам миниатюр в хранилище
+    ключей sorl: {ключ миниатюры: ключ исходника}. Списки читаются
+    потоком за один проход по таблице.
+    """
+    prefix = add_prefix('', 'thumbnails')
+    rows = KVStoreModel.objects.filter(
+        key__startswith=prefix
+    ).values_list('key', 'value')
+    sources = {}
+    for key, value in rows.iterator():
+        for thumbnail_key in json.loads(value):
+            sources[thumbnail_key] = key[len(prefix):]
+    return sources
+
+
+class Command(BaseCommand):
+    help = ('Вытесняет давно не запрошенные миниатюры и варианты '
+            'изображений, пока их каталоги не уложатся в предел. '
+            'Вытесненные файлы создаются заново при следующем показе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-size', type=int, default=THUMBNAIL_CACHE_MAX_SIZE,
+            help='Предел размера миниатюр и вариантов вместе, в байтах.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EVICT_CHUNK_SIZE,
+            help='Сколько файлов вытеснять за один проход.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько будет вытеснено.'
+        )
+
+    def handle(self, *args, max_size, chunk_size, dry_run, **options):
+        buckets = Counter()
+        for path, bucket, size in cached_files():
+            buckets[bucket] += size
+        total = sum(buckets.values())
+        to_free = total - int(max_size * LOW_WATER)
+        if total <= max_size:
+            self.stdout.write(
+                f'Миниатюры и варианты занимают {total} байт из {max_size}'
+            )
+            return
+        freed = 0
+        for cutoff in sorted(buckets):
+            freed += buckets[cutoff]
+            if freed >= to_free:
+                break
+        if dry_run:
+            self.stdout.write(f'Будет вытеснено {freed} байт')
+            return
+        sources = thumbnail_sources()
+        evicted = 0
+        for paths in chunked(
+            (path for path, bucket, size in cached_files()
+             if bucket <= cutoff),
+            chunk_size
+        ):
+            self.evict(paths, sources)
+            evicted += len(paths)
+        self.stdout.write(f'Вытеснено файлов: {evicted}, {freed} байт')
+
+    def evict(self, paths, sources):
+        """Удаляет файлы paths. У миниатюр удаляются и записи
+        в хранилище ключей, а кэш разметки постов, которая на них
+        ссылалась, сбрасывается. Адреса вариантов от файла
+        не зависят: вариант просто закодируется заново.
+
+        sources - результат thumbnail_sources(), из него убираются
+        вытесненные миниатюры.
+        """
+        variants_root = resized_root() + os.sep
+        root = default.storage.path('')
+        names = []
+        for path in paths:
+            if path.startswith(variants_root):
+                remove_variant(path)
+            else:
+                names.append(
+                    os.path.relpath(path, root).replace(os.sep, '/')
+                )
+        if not names:
+            return
+        kvstore = default.kvstore
+        for name in names:
+            default.storage.delete(name)
+        keys = {ImageFile(name, default.storage).key for name in names}
+        kvstore._delete_raw(*(add_prefix(key) for key in keys))
+        source_keys = {sources.pop(key) for key in keys if key in sources}
+        lists = get_raw_many(
+            [add_prefix(key, 'thumbnails') for key in source_keys]
+        )
+        for source_key in source_keys:
+            value = lists.get(add_prefix(source_key, 'thumbnails'))
+            thumbnails = set(json.loads(value)) - keys if value else set()
+            kvstore._set(source_key, list(thumbnails), identity='thumbnails')
+        images = [
+            deserialize_image_file(value).name
+            for value in get_raw_many(
+                [add_prefix(key) for key in source_keys]
+            ).values() if value
+        ]
+        if images:
+            bump_tags(*posts_tags(Post.objects.filter(image__in=images)))
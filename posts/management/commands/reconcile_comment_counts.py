@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.stats import compute_comment_counts
+
+
+class Command(BaseCommand):
+    help = ('Сверяет Post.comment_count с числом комментариев '
+            'и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько постов обрабатывать за один проход.'
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        fixed = 0
+        last_id = 0
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id).order_by('id').only(
+                    'id', 'comment_count'
+                )[:chunk_size]
+            )
+            if not posts:
+                break
+            last_id = posts[-1].id
+            expected = compute_comment_counts([post.id for post in posts])
+            drifted = []
+            for post in posts:
+                if post.comment_count != expected[post.id]:
+                    post.comment_count = expected[post.id]
+                    drifted.append(post)
+            Post.objects.bulk_update(drifted, ['comment_count'])
+            fixed += len(drifted)
+        self.stdout.write(f'Исправлено: {fixed}')
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User, UserStats
+from posts.stats import COUNTERS, compute_stats
+from posts.timeline import followers_changed
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики подписчиков, подписок и записей '
+            'пользователей и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько пользователей обрабатывать за один проход.'
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        fixed = created = 0
+        last_id = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id).order_by(
+                    'id'
+                ).values_list('id', flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            expected = compute_stats(user_ids)
+            existing = UserStats.objects.in_bulk(user_ids)
+            drifted = []
+            switched = []
+            for user_id, counters in expected.items():
+                stats = existing.get(user_id)
+                if stats is None:
+                    continue
+                if any(getattr(stats, field) != value
+                       for field, value in counters.items()):
+                    switched.append((user_id, stats.followers_count,
+                                     counters['followers_count']))
+                    for field, value in counters.items():
+                        setattr(stats, field, value)
+                    drifted.append(stats)
+            missing = [UserStats(user_id=user_id, **expected[user_id])
+                       for user_id in user_ids if user_id not in existing]
+            UserStats.objects.bulk_update(drifted, list(COUNTERS))
+            UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+            for user_id, previous, current in switched:
+                followers_changed(user_id, previous, current)
+            fixed += len(drifted)
+            created += len(missing)
+        self.stdout.write(
+            f'Исправлено: {fixed}, создано: {created}'
+        )
@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+def generate(name):
+    generate_thumbnails(name)
+    return name
+
+
+class Command(BaseCommand):
+    help = ('Создаёт недостающие миниатюры изображений постов '
+            'в нескольких процессах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Число процессов, по умолчанию - число ядер.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help='Сколько изображений передавать процессу за раз.'
+        )
+
+    def handle(self, *args, processes, chunk_size, **options):
+        names = list(
+            Post.objects.filter(image__gt='').order_by().values_list(
+                'image', flat=True
+            ).distinct()
+        )
+        # Дочерние процессы не должны унаследовать открытое соединение
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for done, name in enumerate(
+                pool.map(generate, names, chunksize=chunk_size), 1
+            ):
+                self.stdout.write(f'{done}/{len(names)} {name}')
+        self.stdout.write(f'Обработано изображений: {len(names)}')
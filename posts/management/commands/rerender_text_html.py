@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.markup import RERENDER_BATCH_SIZE, rerender_stale
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает HTML текстов постов и комментариев, '
+            'построенный по старым правилам или не построенный.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=RERENDER_BATCH_SIZE,
+            help='Сколько записей обрабатывать за один проход.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        for model in (Post, Comment):
+            rerendered = rerender_stale(model, batch_size)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {rerendered}'
+            )
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.cache import bump_tags
+from posts.models import Post
+from posts.signals import posts_tags
+from posts.storage import SHARDED_NAME
+from posts.tasks import enqueue
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Переносит изображения постов в двухуровневые каталоги '
+            'по хэшу содержимого и переписывает пути в базе. '
+            'Миниатюры старых путей удаляются и создаются заново '
+            'в фоне. Прерванный перенос можно просто запустить снова.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов переносить за один проход.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        storage = Post._meta.get_field('image').storage
+        legacy = Post.objects.filter(image__gt='').exclude(
+            image__regex=SHARDED_NAME
+        ).order_by('image').values_list('image', flat=True).distinct()
+        moved = missing = 0
+        last_name = ''
+        while True:
+            names = list(legacy.filter(image__gt=last_name)[:batch_size])
+            if not names:
+                break
+            last_name = names[-1]
+            renames = {}
+            for name in names:
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                # Сначала копия: до обновления базы старый файл нужен
+                with storage.open(name) as content:
+                    renames[name] = storage.save(name, content)
+            if not renames:
+                continue
+            with transaction.atomic():
+                Post.objects.filter(image__in=renames).update(image=Case(
+                    *(When(image=old, then=Value(new))
+                      for old, new in renames.items()),
+                    output_field=CharField()
+                ))
+            # Разметка перенесённых постов ссылается на старые пути
+            bump_tags(*posts_tags(
+                Post.objects.filter(image__in=renames.values())
+            ))
+            for old, new in renames.items():
+                default.kvstore.delete(ImageFile(old, storage))
+                storage.delete(old)
+                enqueue(generate_thumbnails, new)
+            moved += len(renames)
+        self.stdout.write(
+            f'Перенесено: {moved}, не найдено файлов: {missing}'
+        )
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+
+from .cache import bump_tags
+from .models import HTML_FIELDS, Post, set_text_html
+from .settings import TEXT_HTML_VERSION
+from .signals import posts_tags
+from .tasks import enqueue
+
+RERENDER_KEY = 'text_html_rerender:{}'
+RERENDER_LOCK_TIMEOUT = 60 * 10
+RERENDER_BATCH_SIZE = 500
+
+
+def rerender_stale(model, batch_size=RERENDER_BATCH_SIZE):
+    """Перестраивает text_html записей model с устаревшей версией.
+
+    Запись обновляется, только если её текст не изменился с момента
+    чтения: иначе HTML уже построило сохранение. Кэш затронутых постов
+    сбрасывается. Возвращает число перестроенных записей.
+    """
+    if model is Post:
+        fields, post_attname = ['id', 'text'], 'id'
+    else:
+        fields, post_attname = ['id', 'text', 'post'], 'post_id'
+    rerendered = 0
+    last_id = 0
+    while True:
+        objects = list(model.objects.exclude(
+            text_html_version=TEXT_HTML_VERSION
+        ).filter(id__gt=last_id).order_by('id').only(*fields)[:batch_size])
+        if not objects:
+            break
+        last_id = objects[-1].id
+        post_ids = set()
+        for obj in objects:
+            set_text_html(obj)
+            if model.objects.filter(id=obj.id, text=obj.text).update(
+                **{field: getattr(obj, field) for field in HTML_FIELDS}
+            ):
+                rerendered += 1
+                post_ids.add(getattr(obj, post_attname))
+        bump_tags(*posts_tags(Post.objects.filter(id__in=post_ids)))
+    cache.delete(RERENDER_KEY.format(model._meta.label_lower))
+    return rerendered
+
+
+def enqueue_rerender(objects):
+    """Ставит в очередь перестройку text_html, если среди objects
+    есть записи, построенные по старым правилам или не построенные.
+    """
+    models = {type(obj) for obj in objects
+              if obj.text_html_version != TEXT_HTML_VERSION}
+    for model in models:
+        if cache.add(RERENDER_KEY.format(model._meta.label_lower), True,
+                     RERENDER_LOCK_TIMEOUT):
+            enqueue(rerender_stale, model)
@@ -0,0 +1,74 @@
+import hashlib
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .cache import get_surrogate_keys, tag_versions
+from .settings import FEED_CACHE_TIMEOUT, PAGE_CACHE_URL_NAMES
+
+PAGE_CACHE_KEY = 'page:{}'
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэширует страницы лент целиком для анонимных читателей.
+
+    Запись хранит версии тегов из заголовка Surrogate-Key ответа и
+    считается устаревшей, как только любой из тегов сброшен, поэтому
+    изменение поста, группы или автора сразу выводит страницу из кэша.
+    При попадании в кэш представление не вызывается.
+
+    Middleware стоит после SessionMiddleware и CsrfViewMiddleware,
+    поэтому их cookie в ответе ещё нет: страницы, которые выдали
+    CSRF-токен или изменили сессию, отсекаются по запросу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        key = getattr(request, '_page_cache_key', None)
+        if key is not None and self.is_cacheable(request, response):
+            versions = getattr(request, 'tag_versions', None)
+            if versions is None:
+                versions = tag_versions(*get_surrogate_keys(response))
+            cache.set(key, {
+                'versions': versions,
+                'response': response,
+            }, FEED_CACHE_TIMEOUT)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method != 'GET'
+                or request.resolver_match.url_name not in PAGE_CACHE_URL_NAMES
+                or request.user.is_authenticated):
+            return None
+        key = PAGE_CACHE_KEY.format(
+            hashlib.md5(request.get_full_path().encode()).hexdigest()
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            versions = entry['versions']
+            if tag_versions(*versions) == versions:
+                response = entry['response']
+                return get_conditional_response(
+                    request,
+                    etag=response.get('ETag'),
+                    last_modified=parse_http_date_safe(
+                        response.get('Last-Modified')
+                    ),
+                    response=response
+                )
+        request._page_cache_key = key
+        return None
+
+    @staticmethod
+    def is_cacheable(request, response):
+        session = getattr(request, 'session', None)
+        return (response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get('CSRF_COOKIE_USED')
+                and not (session is not None and session.modified)
+                and bool(get_surrogate_keys(response)))
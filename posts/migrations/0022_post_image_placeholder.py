@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_post_image_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False, help_text='Размытое превью изображения в виде data URI', verbose_name='Заглушка изображения'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False, help_text='Экранированный текст с переносами строк для шаблонов', verbose_name='HTML текста комментария'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='text_html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Версия правил, по которым построен text_html; 0 - не построен', verbose_name='Версия HTML текста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False, help_text='Экранированный текст с переносами строк для шаблонов', verbose_name='HTML текста поста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Версия правил, по которым построен text_html; 0 - не построен', verbose_name='Версия HTML текста'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:28
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_group_posts_counts(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    counts = Post.objects.filter(
+        group=OuterRef('pk')
+    ).order_by().values('group').annotate(count=Count('id')).values('count')
+    Group.objects.update(posts_count=Coalesce(
+        Subquery(counts, output_field=IntegerField()), 0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_text_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Записей в группе'),
+        ),
+        migrations.RunPython(fill_group_posts_counts,
+                             migrations.RunPython.noop),
+    ]
@@ -1,8 +1,45 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.template.defaultfilters import linebreaksbr
+
+from .settings import TEXT_HTML_VERSION
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
+HTML_FIELDS = ['text_html', 'text_html_version']
+
+
+def render_text(text):
+    """HTML текста поста или комментария: экранированный текст
+    с <br> на месте переносов строк.
+    """
+    return str(linebreaksbr(text, autoescape=True))
+
+
+def set_text_html(obj):
+    obj.text_html = render_text(obj.text)
+    obj.text_html_version = TEXT_HTML_VERSION
+
+
+class TextHtmlMixin:
+    """Строит text_html из text при каждом сохранении, которое
+    записывает text, в том числе с update_fields.
+    """
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None or 'text' in update_fields:
+            set_text_html(self)
+            if update_fields is not None:
+                update_fields = {*update_fields, *HTML_FIELDS}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Всё, что нужно post_item.html, одним запросом."""
+        return self.select_related('author', 'group')
+
 
 class Group(models.Model):
     title = models.CharField(
@@ -22,6 +59,11 @@ class Group(models.Model):
         verbose_name='Описание группы',
         help_text='Введите описание группы'
     )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Записей в группе'
+    )
 
     class Meta:
         verbose_name = 'Группа'
@@ -31,11 +73,24 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class Post(TextHtmlMixin, models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
         help_text='Введите текст поста'
     )
+    text_html = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='HTML текста поста',
+        help_text='Экранированный текст с переносами строк для шаблонов'
+    )
+    text_html_version = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия HTML текста',
+        help_text=('Версия правил, по которым построен text_html; '
+                   '0 - не построен')
+    )
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации'
@@ -58,15 +113,38 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True,
         verbose_name='Изображение',
         help_text=('Вы можете добавить изображение, '
                    'к Вашему посту')
     )
+    image_placeholder = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Заглушка изображения',
+        help_text='Размытое превью изображения в виде data URI'
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество комментариев'
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -77,7 +155,7 @@ class Post(models.Model):
                 f'{self.group}')
 
 
-class Comment(models.Model):
+class Comment(TextHtmlMixin, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -94,6 +172,19 @@ class Comment(models.Model):
         verbose_name='Текст комментария',
         help_text='Введите Ваш комментарий'
     )
+    text_html = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='HTML текста комментария',
+        help_text='Экранированный текст с переносами строк для шаблонов'
+    )
+    text_html_version = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия HTML текста',
+        help_text=('Версия правил, по которым построен text_html; '
+                   '0 - не построен')
+    )
     created = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации комменатрия'
@@ -101,6 +192,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created', )
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -125,9 +220,70 @@ class Follow(models.Model):
         verbose_name='Автор')
 
     class Meta:
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='follow_user_author_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return (f'Подписчик: {self.user.username}, '
                 f'автор: {self.author.username}')
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост')
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста')
+
+    class Meta:
+        ordering = ('-pub_date', )
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_post_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return (f'Читатель: {self.user_id}, '
+                f'пост: {self.post_id}')
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь')
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписок')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Записей')
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return (f'{self.user_id}: '
+                f'подписчиков {self.followers_count}, '
+                f'подписок {self.following_count}, '
+                f'записей {self.posts_count}')
@@ -0,0 +1,205 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .settings import POSTS_PER_PAGE_NUMBER
+
+FORWARD = 'n'
+BACKWARD = 'p'
+PAGE_WINDOW_ON_EACH_SIDE = 3
+PAGE_WINDOW_ON_ENDS = 2
+
+
+def encode_cursor(direction, value, pk):
+    raw = f'{direction}|{value.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (direction, value, pk) или None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(
+            token + '=' * (-len(token) % 4)
+        ).decode()
+        direction, value, pk = raw.split('|')
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (FORWARD, BACKWARD) or value is None:
+        return None
+    return direction, value, pk
+
+
+class CursorPage(Page):
+    """Страница keyset-пагинации.
+
+    Не знает своего номера и общего числа страниц, поэтому
+    навигация строится только по ссылкам next_cursor/previous_cursor.
+    """
+
+    def __init__(self, object_list, paginator, cursor,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page {self.cursor}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CountedPaginator(Paginator):
+    """Пагинатор, которому число объектов сообщают снаружи.
+
+    count - число или функция без аргументов, которая вызывается
+    только при обращении к номерам страниц; без него пагинатор
+    выполняет обычный SELECT COUNT(*).
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is None:
+            return super().count
+        if callable(self.known_count):
+            return self.known_count()
+        return self.known_count
+
+
+class CursorPaginator(CountedPaginator):
+    """Пагинатор по ключу (date_field, id_field) без COUNT и OFFSET.
+
+    Глубина страницы не влияет на стоимость запроса: каждая страница -
+    это диапазонное чтение по индексу от позиции, закодированной в курсоре.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 id_field='id', count=None):
+        self.date_field = date_field
+        self.id_field = id_field
+        self.id_attname = object_list.model._meta.get_field(
+            id_field
+        ).attname
+        super().__init__(
+            object_list.order_by(f'-{date_field}', f'-{id_field}'), per_page,
+            count=count
+        )
+
+    def cursor_for(self, obj, direction=FORWARD):
+        return encode_cursor(
+            direction,
+            getattr(obj, self.date_field),
+            getattr(obj, self.id_attname)
+        )
+
+    def _after(self, value, pk):
+        # Первое условие задаёт границу диапазона для индекса,
+        # второе отсекает записи с той же датой.
+        return (Q(**{f'{self.date_field}__lte': value})
+                & (Q(**{f'{self.date_field}__lt': value})
+                   | Q(**{f'{self.id_field}__lt': pk})))
+
+    def _before(self, value, pk):
+        return (Q(**{f'{self.date_field}__gte': value})
+                & (Q(**{f'{self.date_field}__gt': value})
+                   | Q(**{f'{self.id_field}__gt': pk})))
+
+    def cursor_page(self, token):
+        decoded = decode_cursor(token) if token else None
+        if decoded is None:
+            items = list(self.object_list[:self.per_page + 1])
+            return self._build_page(items, None, has_before=False)
+        direction, value, pk = decoded
+        if direction == FORWARD:
+            items = list(
+                self.object_list.filter(self._after(value, pk))
+                [:self.per_page + 1]
+            )
+            return self._build_page(items, token, has_before=True)
+        items = list(
+            self.object_list.filter(self._before(value, pk)).order_by(
+                self.date_field, self.id_field
+            )[:self.per_page + 1]
+        )
+        has_before = len(items) > self.per_page
+        items = items[:self.per_page][::-1]
+        return self._build_page(
+            items, token, has_before=has_before, has_after=True
+        )
+
+    def _build_page(self, items, token, has_before, has_after=None):
+        if has_after is None:
+            has_after = len(items) > self.per_page
+            items = items[:self.per_page]
+        next_cursor = previous_cursor = None
+        if items and has_after:
+            next_cursor = self.cursor_for(items[-1])
+        if items and has_before:
+            previous_cursor = self.cursor_for(items[0], BACKWARD)
+        return CursorPage(items, self, token, next_cursor, previous_cursor)
+
+
+def paginate(request, queryset, date_field='pub_date', id_field='id',
+             per_page=POSTS_PER_PAGE_NUMBER, count=None):
+    """Страница ленты для запроса.
+
+    С параметром ?cursor= лента листается по ключу, иначе - по номеру
+    страницы; у обычной страницы тоже есть next_cursor, так что
+    кнопка "Следующая" всегда ведёт в режим курсора. count - число
+    записей ленты для CountedPaginator.
+    """
+    paginator = CursorPaginator(
+        queryset, per_page, date_field, id_field, count=count
+    )
+    if 'cursor' in request.GET:
+        return paginator.cursor_page(request.GET['cursor'])
+    page = paginator.get_page(request.GET.get('page'))
+    page.cursor = None
+    page.previous_cursor = None
+    page.next_cursor = (
+        paginator.cursor_for(page[len(page) - 1])
+        if page.has_next() else None
+    )
+    return page
+
+
+def page_window(page, on_each_side=PAGE_WINDOW_ON_EACH_SIDE,
+                on_ends=PAGE_WINDOW_ON_ENDS):
+    """Номера страниц для навигации: окно вокруг текущей страницы
+    и несколько страниц по краям, None - пропуск между ними.
+
+    Строится без перебора всего page_range, поэтому стоимость
+    не зависит от числа страниц.
+    """
+    number = page.number
+    num_pages = page.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2:
+        return list(range(1, num_pages + 1))
+    window = []
+    if number > 1 + on_each_side + on_ends + 1:
+        window += range(1, on_ends + 1)
+        window.append(None)
+        window += range(number - on_each_side, number + 1)
+    else:
+        window += range(1, number + 1)
+    if number < num_pages - on_each_side - on_ends - 1:
+        window += range(number + 1, number + on_each_side + 1)
+        window.append(None)
+        window += range(num_pages - on_ends + 1, num_pages + 1)
+    else:
+        window += range(number + 1, num_pages + 1)
+    return window
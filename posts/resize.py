@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import locks
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from .images import SAVE_OPTIONS
+from .models import Post
+from .settings import RESIZED_IMAGE_MAX_SIDE, RESIZED_IMAGES_DIR
+
+SPEC = re.compile(r'^(?P<width>\d+)x(?P<height>\d+)(?P<crop>c?)'
+                  r'\.(?P<format>jpeg|png|webp)$')
+
+LOCKS_DIR = '.locks'
+LOCK_STRIPES = 256
+
+signer = signing.Signer(salt='posts.resize')
+
+
+def make_spec(geometry, crop=False, image_format='JPEG'):
+    return f'{geometry}{"c" if crop else ""}.{image_format.lower()}'
+
+
+def resized_url(name, spec):
+    """Подписанный адрес варианта изображения name."""
+    signature = signer.signature(f'{spec}/{name}')
+    return reverse('resized_image', args=[signature, spec, name])
+
+
+def check_signature(signature, spec, name):
+    try:
+        signer.unsign(f'{spec}/{name}{signer.sep}{signature}')
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def parse_spec(spec):
+    """Ширина, высота, обрезка и формат из спецификации
+    или None, если спецификация некорректна.
+    """
+    match = SPEC.match(spec)
+    if match is None:
+        return None
+    width, height = int(match['width']), int(match['height'])
+    if not (0 < width <= RESIZED_IMAGE_MAX_SIDE
+            and 0 < height <= RESIZED_IMAGE_MAX_SIDE):
+        return None
+    return width, height, bool(match['crop']), match['format'].upper()
+
+
+def resized_root():
+    return os.path.join(settings.MEDIA_ROOT, RESIZED_IMAGES_DIR)
+
+
+def resized_path(spec, name):
+    """Путь варианта: у каждого изображения свой каталог с его именем,
+    в нём по файлу на спецификацию. По каталогу сборщик мусора
+    находит варианты удалённых изображений.
+    """
+    return os.path.join(resized_root(), name, spec)
+
+
+def lock_path(path):
+    """Файл блокировки для кодирования варианта path. Блокировок
+    LOCK_STRIPES на все варианты, поэтому они не копятся на диске.
+    """
+    stripe = int(hashlib.md5(path.encode()).hexdigest(), 16) % LOCK_STRIPES
+    return os.path.join(resized_root(), LOCKS_DIR, f'{stripe}.lock')
+
+
+def variant_files():
+    """Пути вариантов и имена их исходных изображений."""
+    root = resized_root()
+    for path, dirs, files in os.walk(root):
+        dirs[:] = sorted(directory for directory in dirs
+                         if directory != LOCKS_DIR)
+        for filename in sorted(files):
+            yield (os.path.join(path, filename),
+                   os.path.relpath(path, root).replace(os.sep, '/'))
+
+
+def remove_variant(path):
+    """Удаляет файл варианта и опустевшие каталоги над ним."""
+    os.remove(path)
+    root = resized_root()
+    directory = os.path.dirname(path)
+    while directory != root:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def encode(name, width, height, crop, image_format, path):
+    storage = Post._meta.get_field('image').storage
+    with storage.open(name) as source, Image.open(source) as image:
+        image.draft('RGB', (width, height))
+        if crop:
+            image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            image.thumbnail((width, height), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as output:
+        try:
+            image.save(output, format=image_format,
+                       **SAVE_OPTIONS[image_format])
+        except Exception:
+            os.remove(output.name)
+            raise
+    os.replace(output.name, path)
+
+
+def get_resized(spec, name):
+    """Путь к файлу варианта; вариант кодируется один раз.
+
+    Параллельные запросы одного варианта ждут на файловой блокировке,
+    пока первый из них закодирует файл, и затем отдают готовый.
+    Блокировка общая для группы вариантов (см. lock_path).
+    """
+    path = resized_path(spec, name)
+    if os.path.exists(path):
+        return path
+    lock_file = lock_path(path)
+    os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+    with open(lock_file, 'wb') as lock:
+        locks.lock(lock, locks.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                encode(name, *parse_spec(spec), path)
+        finally:
+            locks.unlock(lock)
+    return path
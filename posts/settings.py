@@ -1 +1,47 @@
+from django.conf import settings
+
 POSTS_PER_PAGE_NUMBER = 10
+TIMELINE_MAX_LENGTH = 800
+FANOUT_MAX_FOLLOWERS = 10000
+# У LocMemCache свой кэш в каждом процессе: сброс тегов в одном
+# процессе или в команде управления до других не доходит. Поэтому
+# с ним лента кэшируется ненадолго, а на сутки - только в общем кэше.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+FEED_CACHE_TIMEOUT = (
+    60 if settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS
+    else 60 * 60 * 24
+)
+PAGE_CACHE_URL_NAMES = ('index', 'group_posts', 'profile')
+TASK_WORKERS = 2
+# Варианты изображения поста: кадр 960x339 в нескольких ширинах
+# и форматах. Вариант 960x339 в JPEG совпадает с вызовом
+# {% thumbnail %} в post_item.html.
+POST_IMAGE_SIZE = (960, 339)
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_FORMATS = ('WEBP', 'JPEG')
+POST_THUMBNAILS = tuple(
+    (f'{width}x{round(width * POST_IMAGE_SIZE[1] / POST_IMAGE_SIZE[0])}',
+     {'crop': 'center', 'upscale': True, 'format': image_format})
+    for image_format in POST_IMAGE_FORMATS
+    for width in POST_IMAGE_WIDTHS
+)
+# Загружаемые изображения: больше POST_IMAGE_MAX_PIXELS не принимаются,
+# большая сторона уменьшается до POST_IMAGE_MAX_SIDE.
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+POST_IMAGE_MAX_SIDE = 2560
+POST_IMAGE_QUALITY = 85
+# Предел размера миниатюр sorl (media/cache) вместе с вариантами
+# resized_image (media/resized), байт
+THUMBNAIL_CACHE_MAX_SIZE = 10 * 1024 ** 3
+# Каталог в MEDIA_ROOT для вариантов, которые отдаёт resized_image
+RESIZED_IMAGES_DIR = 'resized'
+RESIZED_IMAGE_MAX_SIDE = 2560
+# Размытое превью изображения поста, которое встраивается в страницу
+POST_PLACEHOLDER_SIZE = (16, 16)
+POST_PLACEHOLDER_QUALITY = 40
+# Версия правил posts.models.render_text. После изменения правил её нужно
+# увеличить: тексты постов и комментариев перерисуются в фоне
+TEXT_HTML_VERSION = 1
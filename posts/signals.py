@@ -0,0 +1,214 @@
+from django.db.models import Q
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import timeline
+from .cache import bump_tags, make_tag
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .stats import (
+    change_comment_count, change_group_post_count, change_post_count,
+    change_stats
+)
+
+# Поля пользователя, которые выводятся на страницах
+USER_DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, posts_count=1)
+        timeline.enqueue_fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_stats(instance.author_id, posts_count=-1)
+    change_post_count('all', -1)
+    if instance.group_id:
+        change_group_post_count(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_on_follow(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, followers_count=1)
+        change_stats(instance.user_id, following_count=1)
+        timeline.backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def drop_on_unfollow(sender, instance, **kwargs):
+    change_stats(instance.author_id, followers_count=-1)
+    change_stats(instance.user_id, following_count=-1)
+    timeline.drop_from_timeline(instance.user_id, instance.author_id)
+    followers = UserStats.objects.filter(
+        user=instance.author_id
+    ).values_list('followers_count', flat=True).first()
+    if followers is not None:
+        timeline.followers_changed(
+            instance.author_id, followers + 1, followers
+        )
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comment_count(instance.post_id, -1)
+
+
+def post_tags(post_id, author_id, group_ids):
+    tags = ['posts', make_tag('post', post_id), make_tag('author', author_id)]
+    group_ids = [group_id for group_id in group_ids if group_id]
+    if group_ids:
+        tags += [make_tag('group', slug) for slug in Group.objects.filter(
+            id__in=group_ids
+        ).values_list('slug', flat=True)]
+    return tags
+
+
+def posts_tags(posts):
+    """Теги кэша постов из queryset posts: один запрос к постам
+    и один к группам на всю выборку.
+    """
+    tags = set()
+    group_ids = set()
+    for post_id, author_id, group_id in posts.order_by().values_list(
+        'id', 'author', 'group'
+    ):
+        tags.update(post_tags(post_id, author_id, []))
+        group_ids.add(group_id)
+    tags.update(make_tag('group', slug) for slug in Group.objects.filter(
+        id__in=group_ids
+    ).values_list('slug', flat=True))
+    return tags
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, **kwargs):
+    instance._old_group_id = (
+        Post.objects.filter(id=instance.id).values_list(
+            'group', flat=True
+        ).first() if instance.id else None
+    )
+
+
+@receiver(post_save, sender=Post)
+def count_listing_posts(sender, instance, created, **kwargs):
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if created:
+        change_post_count('all', 1)
+    elif old_group_id == instance.group_id:
+        return
+    elif old_group_id:
+        change_group_post_count(old_group_id, -1)
+    if instance.group_id:
+        change_group_post_count(instance.group_id, 1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    bump_tags(*post_tags(
+        instance.id,
+        instance.author_id,
+        [instance.group_id, getattr(instance, '_old_group_id', None)]
+    ))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    post = Post.objects.filter(id=instance.post_id).values(
+        'author', 'group'
+    ).first()
+    if post is None:
+        bump_tags(make_tag('post', instance.post_id))
+        return
+    bump_tags(*post_tags(instance.post_id, post['author'], [post['group']]))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    bump_tags(
+        make_tag('author', instance.author_id),
+        make_tag('author', instance.user_id)
+    )
+
+
+@receiver(pre_save, sender=Group)
+def remember_old_slug(sender, instance, **kwargs):
+    instance._old_slug = (
+        Group.objects.filter(id=instance.id).values_list(
+            'slug', flat=True
+        ).first() if instance.id else None
+    )
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group(sender, instance, created, **kwargs):
+    """Сбрасывает кэш постов группы: их карточки показывают
+    название группы и ссылку на неё.
+    """
+    tags = {'posts', make_tag('group', instance.slug)}
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug:
+        tags.add(make_tag('group', old_slug))
+    if not created:
+        tags.update(posts_tags(instance.posts.all()))
+    bump_tags(*tags)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_posts(sender, instance, **kwargs):
+    # После удаления у постов group = NULL, и найти их уже нельзя
+    instance._post_tags = posts_tags(instance.posts.all())
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_deleted_group(sender, instance, **kwargs):
+    bump_tags('posts', make_tag('group', instance.slug),
+              *getattr(instance, '_post_tags', ()))
+
+
+@receiver(pre_save, sender=User)
+def remember_old_names(sender, instance, update_fields=None, **kwargs):
+    if not instance.id or (
+        update_fields is not None
+        and not set(update_fields) & set(USER_DISPLAY_FIELDS)
+    ):
+        instance._old_names = None
+        return
+    instance._old_names = User.objects.filter(id=instance.id).values_list(
+        *USER_DISPLAY_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, created, **kwargs):
+    """Сбрасывает кэш профиля и постов, где показано имя пользователя:
+    его постов и постов с его комментариями.
+    """
+    old_names = getattr(instance, '_old_names', None)
+    names = tuple(getattr(instance, field) for field in USER_DISPLAY_FIELDS)
+    if created or old_names is None or old_names == names:
+        return
+    bump_tags(make_tag('author', instance.id), *posts_tags(
+        Post.objects.filter(
+            Q(author=instance) | Q(comments__author=instance)
+        ).distinct()
+    ))
@@ -0,0 +1,133 @@
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest
+
+from .models import Comment, Follow, Group, Post, UserStats
+from .settings import FEED_CACHE_TIMEOUT
+from .tasks import enqueue
+
+POST_COUNT_KEY = 'post_count:{}'
+RECOUNT_LOCK_TIMEOUT = 60
+
+COUNTERS = {
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+    'posts_count': (Post, 'author'),
+}
+
+
+def shifted(field, delta):
+    """F(field) + delta, но не меньше нуля: счётчик мог разойтись
+    с данными, и уменьшение не должно нарушать ограничение поля.
+    """
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def change_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя.
+
+    Если строки статистики нет (например, пользователь удаляется
+    каскадом), ничего не делает: расхождения чинит reconcile_user_stats.
+    """
+    UserStats.objects.filter(user=user_id).update(**{
+        field: shifted(field, delta) for field, delta in deltas.items()
+    })
+
+
+def compute_stats(user_ids):
+    """Точные значения счётчиков для пачки пользователей."""
+    stats = {user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids}
+    for field, (model, lookup) in COUNTERS.items():
+        counts = model.objects.filter(
+            **{f'{lookup}__in': user_ids}
+        ).order_by().values_list(lookup).annotate(count=Count('id'))
+        for user_id, count in counts:
+            stats[user_id][field] = count
+    return stats
+
+
+def get_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(
+            user=user, defaults=compute_stats([user.pk])[user.pk]
+        )
+        return stats
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(id=post_id).update(
+        comment_count=shifted('comment_count', delta)
+    )
+
+
+def compute_comment_counts(post_ids):
+    counts = dict.fromkeys(post_ids, 0)
+    counts.update(
+        Comment.objects.filter(post__in=post_ids).order_by().values_list(
+            'post'
+        ).annotate(count=Count('id'))
+    )
+    return counts
+
+
+def change_group_post_count(group_id, delta):
+    Group.objects.filter(id=group_id).update(
+        posts_count=shifted('posts_count', delta)
+    )
+
+
+def change_post_count(listing, delta):
+    """Сдвигает закэшированное число постов ленты listing.
+
+    Если счётчика в кэше нет, ничего не делает: он будет
+    пересчитан при следующем показе ленты.
+    """
+    try:
+        cache.incr(POST_COUNT_KEY.format(listing), delta)
+    except ValueError:
+        pass
+
+
+def recount_posts(listing, queryset):
+    count = queryset.order_by().count()
+    cache.set(POST_COUNT_KEY.format(listing), count, FEED_CACHE_TIMEOUT)
+    return count
+
+
+def cached_post_count(listing, queryset, estimate=None):
+    """Число постов ленты listing без COUNT(*) на каждый запрос.
+
+    Счётчик живёт в кэше и сдвигается сигналами. Если его нет,
+    он пересчитывается: в фоне, если есть функция оценки
+    (тогда до пересчёта возвращается оценка), иначе сразу.
+    """
+    count = cache.get(POST_COUNT_KEY.format(listing))
+    if count is not None:
+        return count
+    if estimate is None:
+        return recount_posts(listing, queryset)
+    if cache.add(POST_COUNT_KEY.format(f'{listing}:recount'), True,
+                 RECOUNT_LOCK_TIMEOUT):
+        enqueue(recount_posts, listing, queryset)
+    return estimate()
+
+
+def estimate_post_count():
+    """Оценка сверху по наибольшему id: одно чтение индекса."""
+    return Post.objects.aggregate(Max('id'))['id__max'] or 0
+
+
+def index_post_count():
+    return cached_post_count('all', Post.objects.all(), estimate_post_count)
+
+
+def group_post_count(group):
+    return group.posts_count
+
+
+def author_post_count(author):
+    return get_stats(author).posts_count
@@ -0,0 +1,52 @@
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+SHARDED_NAME = r'^[^/]+/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - хэш его содержимого.
+
+    Файлы раскладываются по двум уровням каталогов по первым символам
+    хэша (posts/ab/cd/abcd....jpg), чтобы в одном каталоге не копились
+    миллионы файлов.
+
+    Одинаковые загрузки сохраняются один раз и получают одно имя,
+    поэтому и миниатюры для них создаются один раз. Файл удаляется
+    только тогда, когда на него не ссылается ни один пост.
+    """
+
+    def content_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = sha256.hexdigest()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def references(self, name):
+        Post = apps.get_model('posts', 'Post')
+        return Post.objects.filter(image=name).count()
+
+    def delete(self, name):
+        if self.references(name):
+            return
+        super().delete(name)
@@ -0,0 +1,29 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+
+from .settings import TASK_WORKERS
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=TASK_WORKERS, thread_name_prefix='posts-task'
+)
+
+
+def run_task(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+    finally:
+        connection.close()
+
+
+def enqueue(func, *args):
+    """Выполняет func(*args) в фоновом потоке после фиксации
+    текущей транзакции, чтобы задача видела сохранённые данные.
+    """
+    transaction.on_commit(lambda: executor.submit(run_task, func, *args))
@@ -0,0 +1,69 @@
+import re
+
+from django import template
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from posts.cache import make_tag, tags_version
+
+register = template.Library()
+
+EDIT_BUTTON_HOLE = re.compile(r'<!--hole:edit:(\d+):(\S+?)-->')
+
+
+@register.simple_tag
+def tag_version(*parts):
+    """Версия тега для ключа {% cache %}:
+    {% tag_version "group" group.slug as version %}.
+    """
+    return tags_version(make_tag(*parts))
+
+
+@register.simple_tag
+def post_card_version(post):
+    """Версия для ключа карточки поста: меняется вместе с постом,
+    его автором и группой, которые выводятся в карточке.
+    """
+    tags = [make_tag('post', post.id), make_tag('author', post.author_id)]
+    if post.group_id:
+        tags.append(make_tag('group', post.group.slug))
+    return tags_version(*tags)
+
+
+@register.simple_tag
+def edit_button_hole(author_id, url):
+    """Заглушка кнопки редактирования в общей для всех разметке поста.
+
+    Кнопку подставляет {% personalize %} для автора поста.
+    """
+    return format_html('<!--hole:edit:{}:{}-->', author_id, url)
+
+
+class PersonalizeNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        content = self.nodelist.render(context)
+        user = context.get('user')
+        user_id = user.pk if user is not None else None
+
+        def fill(match):
+            if user_id is None or int(match.group(1)) != user_id:
+                return ''
+            return render_to_string('edit_button.html', {
+                'url': mark_safe(match.group(2))
+            })
+
+        return mark_safe(EDIT_BUTTON_HOLE.sub(fill, content))
+
+
+@register.tag
+def personalize(parser, token):
+    """Второй проход по закэшированной разметке: заполняет
+    заглушки, которые зависят от текущего пользователя.
+    """
+    nodelist = parser.parse(('endpersonalize',))
+    parser.delete_first_token()
+    return PersonalizeNode(nodelist)
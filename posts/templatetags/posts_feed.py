@@ -0,0 +1,23 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+POST_ITEM_TEMPLATE = 'post_item.html'
+
+
+@register.simple_tag(takes_context=True)
+def render_posts(context, posts, **options):
+    """Разметка постов ленты: {% render_posts page hide_post_group=True %}.
+
+    Шаблон поста загружается один раз и отрисовывается в цикле
+    в одном и том же контексте - без {% for %} и {% include %}
+    на каждый пост. options попадают в контекст шаблона поста.
+    """
+    item = context.template.engine.get_template(POST_ITEM_TEMPLATE)
+    parts = []
+    with context.push(**options):
+        for post in posts:
+            context['post'] = post
+            parts.append(item.render(context))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,13 @@
+from django import template
+
+from posts.links import build_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def link(name, *args):
+    """Быстрая замена {% url %} для ссылок постов и комментариев:
+    {% link "post" post.author.username post.id %}.
+    """
+    return build_url(name, *args)
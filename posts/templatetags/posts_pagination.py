@@ -0,0 +1,13 @@
+from django import template
+
+from posts.pagination import page_window as build_page_window
+
+register = template.Library()
+
+
+@register.simple_tag
+def page_window(page):
+    """Номера страниц для paginator.html:
+    {% page_window page as window %}.
+    """
+    return build_page_window(page)
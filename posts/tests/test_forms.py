@@ -1,14 +1,18 @@
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.shortcuts import reverse
 from django.test import Client, TestCase, override_settings
 from django import forms
+from PIL import Image
 
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post, User
+from posts.storage import SHARDED_NAME
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 SLUG = 'test-slug'
@@ -25,6 +29,38 @@ TEST_IMAGE = (b'\x47\x49\x46\x38\x39\x61\x01\x00'
 IMAGE_NAME = 'image.gif'
 SECOND_IMAGE_NAME = 'second_image.gif'
 IMAGE_TYPE = 'image/gif'
+EXIF_ORIENTATION = 0x0112
+
+
+def make_jpeg(name, size, orientation=1, frames=1):
+    """JPEG, а при frames > 1 - MPO, как у снимков многих телефонов."""
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    buffer = BytesIO()
+    if frames > 1:
+        image.save(buffer, format='MPO', exif=exif.tobytes(), save_all=True,
+                   append_images=[image.copy()] * (frames - 1))
+    else:
+        image.save(buffer, format='JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(
+        name=name, content=buffer.getvalue(), content_type='image/jpeg'
+    )
+
+
+def make_animated_webp(name, durations):
+    """Анимированный WebP с EXIF и XMP, по кадру на длительность."""
+    frames = [Image.new('RGB', (20, 10), color)
+              for color in ('red', 'blue', 'green')[:len(durations)]]
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    buffer = BytesIO()
+    frames[0].save(buffer, format='WEBP', save_all=True,
+                   append_images=frames[1:], duration=durations, loop=0,
+                   exif=exif.tobytes(), xmp=b'<x:xmpmeta/>')
+    return SimpleUploadedFile(
+        name=name, content=buffer.getvalue(), content_type='image/webp'
+    )
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -104,10 +140,7 @@ class FormsTest(TestCase):
             new_post.group.id,
             form_data['group']
         )
-        self.assertEqual(
-            new_post.image,
-            f'posts/{form_data["image"]}'
-        )
+        self.assertRegex(new_post.image.name, SHARDED_NAME)
         self.assertRedirects(response, INDEX_URL)
 
     def test_edit_existing_post(self):
@@ -139,10 +172,7 @@ class FormsTest(TestCase):
             updated_post.group.id,
             form_data['group']
         )
-        self.assertEqual(
-            updated_post.image,
-            f'posts/{form_data["image"]}'
-        )
+        self.assertRegex(updated_post.image.name, SHARDED_NAME)
         self.assertRedirects(response, self.POST_URL)
 
     def test_anonymous_can_not_create_post(self):
@@ -239,3 +269,121 @@ class FormsTest(TestCase):
         self.assertIsInstance(
             response.context['form'].fields['text'],
             forms.fields.CharField)
+
+    def test_uploaded_image_is_normalized(self):
+        """Загруженное изображение повёрнуто по EXIF, уменьшено
+        и перекодировано без метаданных.
+        """
+        form_data = {
+            'text': 'Пост с большой фотографией',
+            'image': make_jpeg('photo.jpg', (400, 200), orientation=6)
+        }
+        with mock.patch('posts.images.POST_IMAGE_MAX_SIDE', 100):
+            self.authorized_client.post(NEW_POST_URL, data=form_data)
+        post = Post.objects.get(text=form_data['text'])
+        self.assertRegex(post.image.name, SHARDED_NAME)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn('exif', image.info)
+            self.assertTrue(image.info.get('progressive'))
+
+    def test_multi_picture_jpeg_is_normalized(self):
+        """Снимок MPO с кадром превью нормализуется как JPEG."""
+        form_data = {
+            'text': 'Пост со снимком телефона',
+            'image': make_jpeg('phone.jpg', (400, 200), orientation=6,
+                               frames=2)
+        }
+        with mock.patch('posts.images.POST_IMAGE_MAX_SIDE', 100):
+            self.authorized_client.post(NEW_POST_URL, data=form_data)
+        post = Post.objects.get(text=form_data['text'])
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn('exif', image.info)
+
+    def test_animated_image_is_stripped_of_metadata(self):
+        """Анимация перекодируется покадрово: кадры и их длительности
+        остаются, EXIF и XMP - нет.
+        """
+        form_data = {
+            'text': 'Пост с анимацией',
+            'image': make_animated_webp('animation.webp', [100, 200])
+        }
+        self.authorized_client.post(NEW_POST_URL, data=form_data)
+        post = Post.objects.get(text=form_data['text'])
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.n_frames, 2)
+            self.assertNotIn('exif', image.info)
+            self.assertNotIn('xmp', image.info)
+            durations = []
+            for frame in range(image.n_frames):
+                image.seek(frame)
+                image.load()
+                durations.append(image.info['duration'])
+        self.assertEqual(durations, [100, 200])
+
+    def test_unsupported_image_format_is_rejected(self):
+        """Изображение в формате, которого нет в списке, например EPS,
+        отклоняется формой, а не ошибкой сервера.
+        """
+        form_data = {
+            'text': 'Пост с EPS',
+            'image': SimpleUploadedFile(
+                name='drawing.eps',
+                content=(b'%!PS-Adobe-3.0 EPSF-3.0\n'
+                         b'%%BoundingBox: 0 0 10 10\n'
+                         b'0 0 moveto 10 10 lineto stroke\n'),
+                content_type='application/postscript'
+            )
+        }
+        response = self.authorized_client.post(NEW_POST_URL, data=form_data)
+        self.assertFalse(
+            Post.objects.filter(text=form_data['text']).exists()
+        )
+        self.assertTrue(
+            response.context['form'].has_error('image', 'unsupported_image')
+        )
+
+    def test_too_large_image_is_rejected(self):
+        """Изображение с числом пикселей больше предела не принимается."""
+        form_data = {
+            'text': 'Пост с огромной фотографией',
+            'image': make_jpeg('huge.jpg', (400, 200))
+        }
+        with mock.patch('posts.images.POST_IMAGE_MAX_PIXELS', 1000):
+            response = self.authorized_client.post(
+                NEW_POST_URL, data=form_data
+            )
+        self.assertFalse(
+            Post.objects.filter(text=form_data['text']).exists()
+        )
+        self.assertTrue(
+            response.context['form'].has_error('image', 'image_too_large')
+        )
+
+    def test_identical_images_are_stored_once(self):
+        """Одинаковые изображения хранятся одним файлом, который
+        удаляется только вместе с последней ссылкой на него.
+        """
+        for number in range(2):
+            self.authorized_client.post(NEW_POST_URL, data={
+                'text': f'Пост с мемом {number}',
+                'image': SimpleUploadedFile(
+                    name=f'meme_{number}.gif',
+                    content=TEST_IMAGE,
+                    content_type=IMAGE_TYPE
+                )
+            })
+        first, second = Post.objects.filter(
+            text__startswith='Пост с мемом'
+        ).order_by('text')
+        self.assertEqual(first.image.name, second.image.name)
+        storage = first.image.storage
+        first.delete()
+        storage.delete(second.image.name)
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        storage.delete(second.image.name)
+        self.assertFalse(storage.exists(second.image.name))
@@ -0,0 +1,127 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.shortcuts import reverse
+from django.test import Client, TestCase
+
+from posts.cache import make_tag, tags_version
+from posts.markup import enqueue_rerender, rerender_stale
+from posts.models import Comment, Post, User
+from posts.settings import TEXT_HTML_VERSION
+
+USERNAME = 'test_name'
+TEXT = 'Первая <b>строка</b>\nвторая'
+TEXT_HTML = 'Первая &lt;b&gt;строка&lt;/b&gt;<br>вторая'
+
+
+class TextHtmlTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.post = Post.objects.create(text='Текст поста', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def assertRendered(self, obj):
+        obj.refresh_from_db()
+        self.assertEqual(obj.text_html, TEXT_HTML)
+        self.assertEqual(obj.text_html_version, TEXT_HTML_VERSION)
+
+    def test_views_store_rendered_text(self):
+        """Публикация, правка и комментарий сохраняют готовый HTML."""
+        self.authorized_client.post(reverse('new_post'), {'text': TEXT})
+        self.assertRendered(Post.objects.exclude(id=self.post.id).get())
+        self.authorized_client.post(
+            reverse('post_edit', args=[USERNAME, self.post.id]),
+            {'text': TEXT}
+        )
+        self.assertRendered(self.post)
+        self.authorized_client.post(
+            reverse('add_comment', args=[USERNAME, self.post.id]),
+            {'text': TEXT}
+        )
+        self.assertRendered(Comment.objects.get())
+
+    def test_model_save_stores_rendered_text(self):
+        """HTML строится при любом сохранении текста, в том числе
+        с update_fields, и не трогается, если текст не сохраняется.
+        """
+        post = Post.objects.create(text=TEXT, author=self.user)
+        self.assertRendered(post)
+        Post.objects.filter(id=post.id).update(text_html='')
+        post.text = 'Другой текст'
+        post.save(update_fields=['group'])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '')
+        post.text = TEXT
+        post.save(update_fields=['text'])
+        self.assertRendered(post)
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Комментарий'
+        )
+        comment.text = TEXT
+        comment.save()
+        self.assertRendered(comment)
+
+    def test_templates_use_stored_html(self):
+        """Шаблоны выводят сохранённый HTML, а для записей без него
+        строят его сами.
+        """
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text=TEXT
+        )
+        url = reverse('post', args=[USERNAME, self.post.id])
+        self.assertContains(self.client.get(url), TEXT_HTML, html=True)
+        cache.clear()
+        for model, obj in [(Post, self.post), (Comment, comment)]:
+            model.objects.filter(id=obj.id).update(
+                text_html=f'<i>{model.__name__}</i>',
+                text_html_version=TEXT_HTML_VERSION
+            )
+        response = self.client.get(url)
+        self.assertContains(response, '<i>Post</i>', html=True)
+        self.assertContains(response, '<i>Comment</i>', html=True)
+
+    def test_rerender_stale(self):
+        """Записи со старой версией HTML перестраиваются, а кэш
+        их постов сбрасывается.
+        """
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text=TEXT
+        )
+        Comment.objects.filter(id=comment.id).update(text_html_version=0)
+        Post.objects.filter(id=self.post.id).update(
+            text=TEXT, text_html_version=0
+        )
+        version = tags_version(make_tag('post', self.post.id))
+        self.assertEqual(rerender_stale(Post), 1)
+        self.assertEqual(rerender_stale(Comment), 1)
+        self.assertRendered(self.post)
+        self.assertRendered(comment)
+        self.assertGreater(
+            tags_version(make_tag('post', self.post.id)), version
+        )
+        self.assertEqual(rerender_stale(Post), 0)
+
+    def test_stale_page_enqueues_rerender_once(self):
+        post = Post.objects.get(id=self.post.id)
+        post.text_html_version = 0
+        with mock.patch('posts.markup.enqueue') as enqueue:
+            enqueue_rerender([post])
+            enqueue_rerender([post])
+        enqueue.assert_called_once_with(rerender_stale, Post)
+
+    def test_rerender_command(self):
+        Post.objects.filter(id=self.post.id).update(
+            text=TEXT, text_html_version=0
+        )
+        output = StringIO()
+        call_command('rerender_text_html', batch_size=1, stdout=output)
+        self.assertRendered(self.post)
+        self.assertIn('Посты: 1', output.getvalue())
@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.shortcuts import reverse
+from django.test import Client, TestCase
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.settings import POSTS_PER_PAGE_NUMBER
+from posts.tests.utils import assert_feed_uses_indexes, eager_tasks
+
+SLUG = 'test-slug'
+USERNAME = 'test_name'
+AUTHOR_USERNAME = 'author_name'
+INDEX_URL = reverse('index')
+GROUP_URL = reverse('group_posts', args=[SLUG])
+PROFILE_URL = reverse('profile', args=[AUTHOR_USERNAME])
+FOLLOW_URL = reverse('follow_index')
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.author = User.objects.create(username=AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title='Тестовое название',
+            slug=SLUG,
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        with eager_tasks():
+            for number in range(POSTS_PER_PAGE_NUMBER + 1):
+                cls.post = Post.objects.create(
+                    text=f'Пост {number}',
+                    author=cls.author,
+                    group=cls.group
+                )
+        Comment.objects.create(
+            text='Текст комментария',
+            post=cls.post,
+            author=cls.user
+        )
+        cls.POST_URL = reverse('post', args=[AUTHOR_USERNAME, cls.post.id])
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_read_posts_by_index(self):
+        """Ленты читаются по индексам, без полного сканирования
+        и сортировки во временном B-дереве.
+        """
+        for url in [INDEX_URL, GROUP_URL, PROFILE_URL, FOLLOW_URL,
+                    self.POST_URL]:
+            assert_feed_uses_indexes(self, self.authorized_client, url)
+
+    def test_cursor_pages_read_posts_by_index(self):
+        """Страницы по курсору читаются по индексам."""
+        for url in [INDEX_URL, GROUP_URL, PROFILE_URL, FOLLOW_URL]:
+            page = self.authorized_client.get(url).context['page']
+            assert_feed_uses_indexes(
+                self, self.authorized_client, url,
+                {'cursor': page.next_cursor}
+            )
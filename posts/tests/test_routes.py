@@ -1,10 +1,15 @@
 from django.test import TestCase
 from django.shortcuts import reverse
+from django.urls import set_script_prefix
 
+from posts.links import build_url
 from posts.models import Post, User
 
 SLUG = 'test-slug'
 USERNAME = 'test_name'
+LINK_USERNAMES = [USERNAME, 'a.b@c+d-e_f', 'Ёжик']
+LINK_POST_IDS = [1, 7305186492000]
+LINK_SLUGS = [SLUG, 'A-b_1']
 
 
 class RoutesTest(TestCase):
@@ -33,3 +38,21 @@ class RoutesTest(TestCase):
         ]
         for route, name in routes_reverse_names:
             self.assertEqual(route, name)
+
+    def test_build_url_matches_reverse(self):
+        """Ссылки из шаблонов адресов совпадают с reverse()."""
+        links = [('group_posts', [slug]) for slug in LINK_SLUGS]
+        for username in LINK_USERNAMES:
+            links.append(('profile', [username]))
+            links.extend(
+                (name, [username, post_id])
+                for name in ['post', 'post_edit', 'add_comment']
+                for post_id in LINK_POST_IDS
+            )
+        self.addCleanup(set_script_prefix, '/')
+        for prefix in ['/', '/yatube/']:
+            set_script_prefix(prefix)
+            for name, args in links:
+                with self.subTest(prefix=prefix, name=name, args=args):
+                    self.assertEqual(build_url(name, *args),
+                                     reverse(name, args=args))
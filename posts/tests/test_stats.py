@@ -0,0 +1,108 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts.models import Comment, Follow, Post, User, UserStats
+
+USERNAME = 'test_name'
+AUTHOR_USERNAME = 'author_name'
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.author = User.objects.create(username=AUTHOR_USERNAME)
+
+    def get_stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_posts_and_subscriptions(self):
+        """Счётчики меняются при подписке, отписке,
+        публикации и удалении постов.
+        """
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Текст поста', author=self.author)
+        self.assertEqual(self.get_stats(self.author).followers_count, 1)
+        self.assertEqual(self.get_stats(self.user).following_count, 1)
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+        follow.delete()
+        post.delete()
+        author_stats = self.get_stats(self.author)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(self.get_stats(self.user).following_count, 0)
+
+    def test_decrement_of_drifted_counter_stops_at_zero(self):
+        """Удаление подписки, не попавшей в счётчики, не уводит
+        их ниже нуля.
+        """
+        Follow.objects.bulk_create(
+            [Follow(user=self.user, author=self.author)]
+        )
+        Follow.objects.get(user=self.user, author=self.author).delete()
+        self.assertEqual(self.get_stats(self.author).followers_count, 0)
+        self.assertEqual(self.get_stats(self.user).following_count, 0)
+
+    def test_reconcile_command_repairs_drift(self):
+        """Команда reconcile_user_stats исправляет разошедшиеся счётчики
+        и создаёт недостающую статистику.
+        """
+        Post.objects.create(text='Текст поста', author=self.author)
+        UserStats.objects.filter(user=self.author).update(
+            posts_count=42, followers_count=7
+        )
+        UserStats.objects.filter(user=self.user).delete()
+        call_command('reconcile_user_stats', chunk_size=1, stdout=StringIO())
+        author_stats = self.get_stats(self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertTrue(UserStats.objects.filter(user=self.user).exists())
+
+
+class CommentCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.post = Post.objects.create(text='Текст поста', author=cls.user)
+
+    def get_comment_count(self):
+        return Post.objects.get(id=self.post.id).comment_count
+
+    def test_comment_count_follows_comments(self):
+        """Post.comment_count меняется при добавлении
+        и удалении комментариев.
+        """
+        comment = Comment.objects.create(
+            text='Текст комментария', post=self.post, author=self.user
+        )
+        Comment.objects.create(
+            text='Второй комментарий', post=self.post, author=self.user
+        )
+        self.assertEqual(self.get_comment_count(), 2)
+        comment.delete()
+        self.assertEqual(self.get_comment_count(), 1)
+        User.objects.filter(id=self.user.id).delete()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_decrement_of_drifted_comment_count_stops_at_zero(self):
+        """Удаление комментария, не попавшего в счётчик,
+        не уводит его ниже нуля.
+        """
+        Comment.objects.bulk_create([Comment(
+            text='Текст комментария', post=self.post, author=self.user
+        )])
+        Comment.objects.get().delete()
+        self.assertEqual(self.get_comment_count(), 0)
+
+    def test_reconcile_command_repairs_comment_count(self):
+        """Команда reconcile_comment_counts исправляет счётчик."""
+        Comment.objects.create(
+            text='Текст комментария', post=self.post, author=self.user
+        )
+        Post.objects.filter(id=self.post.id).update(comment_count=5)
+        call_command('reconcile_comment_counts', stdout=StringIO())
+        self.assertEqual(self.get_comment_count(), 1)
@@ -0,0 +1,223 @@
+import math
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.cache import make_tag, tags_version
+from posts.management.commands.evict_thumbnails import LOW_WATER
+from posts.models import Post, User
+from posts.resize import get_resized, resized_root
+from posts.settings import POST_THUMBNAILS
+from posts.storage import SHARDED_NAME
+from posts.tests.utils import eager_tasks
+from posts.thumbnails import DeferredThumbnailBackend, generate_thumbnails
+
+RESIZE_SPEC = '100x50c.jpeg'
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+USERNAME = 'test_name'
+LEGACY_NAME = 'posts/legacy.gif'
+MISSING_NAME = 'posts/missing.gif'
+TEST_IMAGE = (b'\x47\x49\x46\x38\x39\x61\x01\x00'
+              b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+              b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+              b'\x00\x00\x01\x00\x01\x00\x00\x02'
+              b'\x02\x4c\x01\x00\x3b')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ShardPostImagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(TEMP_MEDIA_ROOT, LEGACY_NAME), 'wb') as file:
+            file.write(TEST_IMAGE)
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.user, image=image)
+            for number, image in enumerate(
+                [LEGACY_NAME, LEGACY_NAME, MISSING_NAME]
+            )
+        )
+
+    def test_legacy_images_are_moved_to_sharded_directories(self):
+        """Команда переносит файлы и переписывает пути,
+        повторный запуск ничего не делает.
+        """
+        call_command('shard_post_images', batch_size=1, stdout=StringIO())
+        names = set(Post.objects.exclude(
+            image=MISSING_NAME
+        ).values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertRegex(name, SHARDED_NAME)
+        storage = Post._meta.get_field('image').storage
+        self.assertTrue(storage.exists(name))
+        self.assertFalse(storage.exists(LEGACY_NAME))
+        output = StringIO()
+        call_command('shard_post_images', stdout=output)
+        self.assertIn('Перенесено: 0', output.getvalue())
+
+    def test_moved_posts_drop_legacy_thumbnails_and_cache(self):
+        """Записи и файлы миниатюр старого пути удаляются, кэш
+        перенесённых постов сбрасывается, миниатюры создаются заново.
+        """
+        cache.clear()
+        generate_thumbnails(LEGACY_NAME)
+        storage = Post._meta.get_field('image').storage
+        legacy = ImageFile(LEGACY_NAME, storage)
+        legacy_thumbnails = default.kvstore._get(
+            legacy.key, identity='thumbnails'
+        )
+        self.assertTrue(legacy_thumbnails)
+        post = Post.objects.filter(image=LEGACY_NAME).first()
+        version = tags_version(make_tag('post', post.id))
+        with eager_tasks():
+            call_command('shard_post_images', stdout=StringIO())
+        self.assertIsNone(default.kvstore.get(legacy))
+        for key in legacy_thumbnails:
+            self.assertIsNone(default.kvstore._get(key))
+        self.assertNotEqual(tags_version(make_tag('post', post.id)), version)
+        post.refresh_from_db()
+        self.assertTrue(default.kvstore._get(
+            ImageFile(post.image.name, storage).key, identity='thumbnails'
+        ))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CollectOrphanMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, text, content):
+        post = Post.objects.create(text=text, author=self.user)
+        post.image.save('image.gif', ContentFile(content))
+        generate_thumbnails(post.image.name)
+        return post
+
+    def thumbnail_names(self, name):
+        source = ImageFile(name, Post._meta.get_field('image').storage)
+        return [default.kvstore.get(
+            DeferredThumbnailBackend().thumbnail_file(
+                source, geometry, dict(options)
+            )
+        ).name for geometry, options in POST_THUMBNAILS]
+
+    def test_orphans_are_removed(self):
+        """Удаляются только файлы без ссылок: изображения удалённых
+        постов вместе с миниатюрами и вариантами и потерянные миниатюры.
+        """
+        kept = self.create_post('Пост', TEST_IMAGE)
+        removed = self.create_post('Удалённый пост', TEST_IMAGE + b'\x00')
+        removed_name = removed.image.name
+        removed_thumbnails = self.thumbnail_names(removed_name)
+        kept_variant = get_resized(RESIZE_SPEC, kept.image.name)
+        removed_variant = get_resized(RESIZE_SPEC, removed_name)
+        removed.delete()
+        stray_thumbnail = default.storage.save(
+            'cache/00/00/stray.jpg', ContentFile(TEST_IMAGE)
+        )
+        storage = kept.image.storage
+        call_command('collect_orphan_media', min_age=0, dry_run=True,
+                     stdout=StringIO())
+        self.assertTrue(storage.exists(removed_name))
+        self.assertTrue(default.storage.exists(stray_thumbnail))
+        self.assertTrue(os.path.exists(removed_variant))
+        call_command('collect_orphan_media', min_age=0, stdout=StringIO())
+        self.assertTrue(storage.exists(kept.image.name))
+        for name in self.thumbnail_names(kept.image.name):
+            self.assertTrue(default.storage.exists(name))
+        self.assertFalse(storage.exists(removed_name))
+        for name in removed_thumbnails:
+            self.assertFalse(default.storage.exists(name))
+        self.assertFalse(default.storage.exists(stray_thumbnail))
+        self.assertTrue(os.path.exists(kept_variant))
+        self.assertFalse(os.path.exists(removed_variant))
+        self.assertFalse(os.path.exists(
+            os.path.join(resized_root(), removed_name)
+        ))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class EvictThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self, text, content):
+        post = Post.objects.create(text=text, author=self.user)
+        post.image.save('image.gif', ContentFile(content))
+        generate_thumbnails(post.image.name)
+        return post
+
+    def thumbnails(self, post):
+        backend = DeferredThumbnailBackend()
+        return [backend.thumbnail_file(post.image, geometry, dict(options))
+                for geometry, options in POST_THUMBNAILS]
+
+    def test_least_recently_used_thumbnails_are_evicted(self):
+        """Вытесняются давно не запрошенные миниатюры и варианты,
+        записи миниатюр в хранилище ключей и разметка поста.
+        """
+        stale = self.create_post('Старый пост', TEST_IMAGE)
+        fresh = self.create_post('Новый пост', TEST_IMAGE + b'\x00')
+        stale_variant = get_resized(RESIZE_SPEC, stale.image.name)
+        long_ago = time.time() - 30 * 24 * 60 * 60
+        for path in [stale_variant] + [
+            default.storage.path(thumbnail.name)
+            for thumbnail in self.thumbnails(stale)
+        ]:
+            os.utime(path, (long_ago, long_ago))
+        fresh_size = sum(default.storage.size(thumbnail.name)
+                         for thumbnail in self.thumbnails(fresh))
+        version = tags_version(make_tag('post', stale.id))
+        call_command('evict_thumbnails',
+                     max_size=math.ceil(fresh_size / LOW_WATER) + 1,
+                     chunk_size=2, stdout=StringIO())
+        self.assertFalse(os.path.exists(stale_variant))
+        for thumbnail in self.thumbnails(stale):
+            self.assertFalse(default.storage.exists(thumbnail.name))
+            self.assertIsNone(default.kvstore.get(thumbnail))
+        self.assertEqual(default.kvstore._get(
+            ImageFile(stale.image.name, stale.image.storage).key,
+            identity='thumbnails'
+        ), [])
+        for thumbnail in self.thumbnails(fresh):
+            self.assertTrue(default.storage.exists(thumbnail.name))
+            self.assertIsNotNone(default.kvstore.get(thumbnail))
+        self.assertNotEqual(
+            tags_version(make_tag('post', stale.id)), version
+        )
@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from sorl.thumbnail import default
+
+from posts.cache import make_tag, tags_version
+from posts.models import Post, User
+from posts.resize import encode, resized_path, resized_url
+from posts.settings import (
+    POST_IMAGE_FORMATS, POST_IMAGE_WIDTHS, POST_THUMBNAILS
+)
+from posts.thumbnails import generate_thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+USERNAME = 'test_name'
+RESIZE_SPEC = '100x50c.jpeg'
+TEST_IMAGE = (b'\x47\x49\x46\x38\x39\x61\x01\x00'
+              b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+              b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+              b'\x00\x00\x01\x00\x01\x00\x00\x02'
+              b'\x02\x4c\x01\x00\x3b')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.post = Post.objects.create(
+            text='Тестовый текст поста',
+            author=cls.user,
+            image=SimpleUploadedFile(
+                name='thumbnail.gif',
+                content=TEST_IMAGE,
+                content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_thumbnail(self):
+        geometry, options = POST_THUMBNAILS[0]
+        return default.backend.get_thumbnail(
+            self.post.image, geometry, **options
+        )
+
+    def test_template_backend_does_not_encode_images(self):
+        """Без готовой миниатюры шаблон получает адрес
+        resized_image, а не закодированный файл.
+        """
+        thumbnail = self.get_thumbnail()
+        self.assertEqual(thumbnail.name, self.post.image.name)
+        self.assertTrue(thumbnail.url.startswith('/resize/'))
+
+    def test_resized_image_is_encoded_once(self):
+        """Вариант кодируется при первом запросе и дальше
+        отдаётся с диска, а рядом с ним не остаётся файлов блокировок.
+        """
+        url = resized_url(self.post.image.name, RESIZE_SPEC)
+        with mock.patch('posts.resize.encode', wraps=encode) as encoder:
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'image/jpeg')
+                content = b''.join(response.streaming_content)
+                with Image.open(BytesIO(content)) as image:
+                    self.assertEqual(image.size, (100, 50))
+        self.assertEqual(encoder.call_count, 1)
+        path = resized_path(RESIZE_SPEC, self.post.image.name)
+        self.assertEqual(os.listdir(os.path.dirname(path)), [RESIZE_SPEC])
+
+    def test_resized_image_requires_valid_signature(self):
+        """Адрес с чужой спецификацией или подписью не работает."""
+        url = resized_url(self.post.image.name, RESIZE_SPEC)
+        for bad_url in [url.replace(RESIZE_SPEC, '2000x2000.jpeg'),
+                        url.replace('/resize/', '/resize/x')]:
+            with self.subTest(url=bad_url):
+                self.assertEqual(self.client.get(bad_url).status_code, 404)
+
+    def test_generated_thumbnails_are_served_and_purge_cache(self):
+        """Фоновая задача создаёт миниатюру и сбрасывает кэш поста."""
+        version = tags_version(make_tag('post', self.post.id))
+        generate_thumbnails(self.post.image.name)
+        thumbnail = self.get_thumbnail()
+        self.assertNotEqual(thumbnail.name, self.post.image.name)
+        self.assertTrue(thumbnail.exists())
+        self.assertNotEqual(
+            tags_version(make_tag('post', self.post.id)), version
+        )
+
+    def test_page_thumbnails_are_fetched_in_one_query(self):
+        """Сведения о миниатюрах страницы читаются одним запросом."""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.user,
+                 image=f'posts/missing_{number}.gif')
+            for number in range(5)
+        )
+        generate_thumbnails(self.post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        kvstore_queries = [query for query in queries.captured_queries
+                           if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertNotContains(response, self.post.image.url)
+
+    def test_page_shows_responsive_variants(self):
+        """Страница выводит srcset всех форматов и ширин."""
+        generate_thumbnails(self.post.image.name)
+        response = self.client.get(reverse('index'))
+        for image_format in POST_IMAGE_FORMATS:
+            with self.subTest(image_format=image_format):
+                self.assertContains(
+                    response, f'type="image/{image_format.lower()}"'
+                )
+        for width in POST_IMAGE_WIDTHS:
+            with self.subTest(width=width):
+                self.assertContains(response, f' {width}w', count=2)
+
+    def test_placeholder_is_stored_and_inlined(self):
+        """Фоновая задача сохраняет в посте крошечное превью,
+        и страница встраивает его под лениво загружаемое изображение.
+        """
+        generate_thumbnails(self.post.image.name)
+        placeholder = Post.objects.get(id=self.post.id).image_placeholder
+        self.assertTrue(placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(placeholder), 1000)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, placeholder)
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_missing_images_are_skipped(self):
+        """Задача не падает на отсутствующем файле."""
+        generate_thumbnails('posts/missing.gif')
@@ -0,0 +1,124 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.shortcuts import reverse
+from django.test import Client, TestCase
+
+from posts.models import Follow, Post, TimelineEntry, User
+from posts.tests.utils import eager_tasks
+from posts.timeline import fan_out_post, pulled_authors, timeline_posts
+
+USERNAME = 'test_name'
+AUTHOR_USERNAME = 'author_name'
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.author = User.objects.create(username=AUTHOR_USERNAME)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_post_is_written_to_follower_timeline(self):
+        """Новый пост автора попадает в ленту подписчика
+        фоновой задачей, а не во время публикации.
+        """
+        Follow.objects.create(user=self.user, author=self.author)
+        with mock.patch('posts.timeline.enqueue') as enqueue:
+            post = Post.objects.create(text='Текст поста', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        enqueue.assert_called_once_with(fan_out_post, post.id)
+        with eager_tasks():
+            fan_out_post(post.id)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        self.assertEqual(list(timeline_posts(self.user)), [post])
+
+    def test_follow_backfills_and_unfollow_clears_timeline(self):
+        """Подписка заполняет ленту старыми постами,
+        отписка удаляет их из ленты.
+        """
+        post = Post.objects.create(text='Текст поста', author=self.author)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(list(timeline_posts(self.user)), [post])
+        follow.delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists()
+        )
+
+    def test_timeline_length_is_bounded(self):
+        """Длина ленты читателя ограничена, в ней остаются новые посты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        with eager_tasks(), \
+                mock.patch('posts.timeline.TIMELINE_MAX_LENGTH', 2), \
+                mock.patch('posts.timeline.TRIM_SAMPLE_RATE', 1):
+            posts = [
+                Post.objects.create(text=f'Пост {number}', author=self.author)
+                for number in range(4)
+            ]
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.user).values_list(
+                'post', flat=True
+            )),
+            {posts[2].id, posts[3].id}
+        )
+
+    def test_popular_author_posts_are_pulled_on_read(self):
+        """Посты авторов с большим числом подписчиков
+        не раскладываются по лентам, а подмешиваются при чтении.
+        """
+        Follow.objects.create(user=self.user, author=self.author)
+        with mock.patch('posts.timeline.FANOUT_MAX_FOLLOWERS', 0):
+            post = Post.objects.create(text='Текст поста',
+                                       author=self.author)
+            self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+            self.assertEqual(list(timeline_posts(self.user)), [post])
+
+    def test_timelines_are_trimmed_by_sample(self):
+        """После раскладки проверяются не все ленты подписчиков,
+        а только попавшие в выборку.
+        """
+        Follow.objects.create(user=self.user, author=self.author)
+        with eager_tasks(), \
+                mock.patch('posts.timeline.TIMELINE_MAX_LENGTH', 1), \
+                mock.patch('posts.timeline.random.randrange',
+                           return_value=1):
+            for number in range(3):
+                Post.objects.create(text=f'Пост {number}', author=self.author)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 3
+        )
+
+    def test_pull_timeline_finds_pulled_authors_once(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        client = Client()
+        client.force_login(self.user)
+        with mock.patch('posts.timeline.FANOUT_MAX_FOLLOWERS', 0), \
+                mock.patch('posts.timeline.pulled_authors',
+                           wraps=pulled_authors) as finder:
+            post = Post.objects.create(text='Текст поста',
+                                       author=self.author)
+            response = client.get(reverse('follow_index'))
+        self.assertEqual(response.context['page'].object_list, [post])
+        finder.assert_called_once()
+
+    def test_author_leaving_pull_mode_backfills_followers(self):
+        """Когда автор выходит из pull-режима, его посты раскладываются
+        по лентам подписчиков, подписавшихся в pull-режиме.
+        """
+        other = User.objects.create(username='other_reader')
+        Follow.objects.create(user=other, author=self.author)
+        with eager_tasks(), \
+                mock.patch('posts.timeline.FANOUT_MAX_FOLLOWERS', 1):
+            Follow.objects.create(user=self.user, author=self.author)
+            post = Post.objects.create(text='Текст поста',
+                                       author=self.author)
+            self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+            Follow.objects.get(user=other).delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
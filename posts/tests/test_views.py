@@ -1,13 +1,26 @@
 import shutil
 import tempfile
+from io import StringIO
 
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.db import connection
 from django.shortcuts import reverse
-from django.test import Client, TestCase, override_settings
+from django.template import Context, engines
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
 
+from posts.cache import bump_tags, make_tag, set_surrogate_keys
+from posts.middleware import AnonymousPageCacheMiddleware
 from posts.models import Comment, Follow, Group, Post, User
+from posts.pagination import page_window
 from posts.settings import POSTS_PER_PAGE_NUMBER
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -71,6 +84,9 @@ class PagesTests(TestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
+    def setUp(self):
+        cache.clear()
+
     def test_posts_on_pages_show_correct_context(self):
         """Страницы с постами сформированы с правильным контекстом."""
         self.authorized_client.get(PROFILE_FOLLOW_URL)
@@ -217,10 +233,10 @@ class PagesTests(TestCase):
     def test_index_page_is_cached(self):
         """Cписок постов на странице index хранится в кэше."""
         response = self.authorized_client.get(INDEX_URL)
-        Post.objects.create(
-            text='Текст, который отобразится через 20 сек',
+        Post.objects.bulk_create([Post(
+            text='Текст, который не сбрасывает кэш',
             author=self.user
-        )
+        )])
         cached_response = self.authorized_client.get(INDEX_URL)
         self.assertEqual(
             response.content,
@@ -233,6 +249,45 @@ class PagesTests(TestCase):
             not_cached_response.content
         )
 
+    def test_cached_pages_are_invalidated_by_changes(self):
+        """Новый пост и новый комментарий сразу видны
+        на закэшированных страницах.
+        """
+        urls = [INDEX_URL, POST_GROUP_URL, PROFILE_URL, self.POST_URL]
+        for url in urls:
+            self.authorized_client.get(url)
+        Post.objects.filter(id=self.post.id).update(
+            text='Новый текст поста', text_html='Новый текст поста'
+        )
+        Comment.objects.create(
+            text='Новый комментарий',
+            post=self.post,
+            author=self.user
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.authorized_client.get(url),
+                    'Новый текст поста'
+                )
+
+    def test_cached_pages_show_edit_button_only_to_author(self):
+        """Кнопка редактирования в закэшированной разметке
+        видна только автору поста.
+        """
+        author_client = Client()
+        author_client.force_login(self.user_author)
+        urls = [INDEX_URL, POST_GROUP_URL, PROFILE_URL, self.POST_URL]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(author_client.get(url), 'Редактировать')
+                self.assertNotContains(
+                    self.authorized_client.get(url), 'Редактировать'
+                )
+                self.assertNotContains(
+                    self.guest_client.get(url), 'Редактировать'
+                )
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -245,6 +300,7 @@ class PaginatorViewsTest(TestCase):
                 author=cls.user)
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
 
     def test_first_page_contains_expected_number_of_records(self):
@@ -263,3 +319,411 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(
             len(self.client.get(INDEX_URL + '?page=2').context['page']), 3
         )
+
+    def test_page_window_is_elided(self):
+        """Навигация показывает окно вокруг текущей страницы
+        и края, а не все страницы.
+        """
+        paginator = Paginator(range(1000), 1)
+        self.assertEqual(
+            page_window(paginator.page(500)),
+            [1, 2, None, 497, 498, 499, 500, 501, 502, 503, None, 999, 1000]
+        )
+        self.assertEqual(
+            page_window(paginator.page(2)),
+            [1, 2, 3, 4, 5, None, 999, 1000]
+        )
+        self.assertEqual(
+            page_window(Paginator(range(5), 1).page(3)), [1, 2, 3, 4, 5]
+        )
+
+    def test_next_cursor_leads_to_second_page(self):
+        """Курсор следующей страницы index ведёт
+        на оставшиеся записи.
+        """
+        first_page = self.client.get(INDEX_URL).context['page']
+        second_page = self.client.get(
+            INDEX_URL, {'cursor': first_page.next_cursor}
+        ).context['page']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(
+            set(first_page).isdisjoint(second_page)
+        )
+
+    def test_previous_cursor_leads_back_to_first_page(self):
+        """Курсор предыдущей страницы возвращает на первую страницу."""
+        first_page = self.client.get(INDEX_URL).context['page']
+        second_page = self.client.get(
+            INDEX_URL, {'cursor': first_page.next_cursor}
+        ).context['page']
+        previous_page = self.client.get(
+            INDEX_URL, {'cursor': second_page.previous_cursor}
+        ).context['page']
+        self.assertEqual(list(previous_page), list(first_page))
+        self.assertFalse(previous_page.has_previous())
+
+    def test_broken_cursor_shows_first_page(self):
+        """Некорректный курсор открывает первую страницу."""
+        page = self.client.get(
+            INDEX_URL, {'cursor': 'broken'}
+        ).context['page']
+        self.assertEqual(len(page), POSTS_PER_PAGE_NUMBER)
+        self.assertFalse(page.has_previous())
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.user_author = User.objects.create(username=AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title='Тестовое название',
+            slug=SLUG,
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.user_author)
+        cls.post = Post.objects.create(
+            text='Тестовый текст поста',
+            author=cls.user_author,
+            group=cls.group
+        )
+        cls.POST_URL = reverse('post', args=[
+            AUTHOR_USERNAME, cls.post.id])
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_client.get(url)
+        return len(context)
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        urls = [INDEX_URL, POST_GROUP_URL, PROFILE_URL, FOLLOW_URL]
+        single_post_queries = {url: self.count_queries(url) for url in urls}
+        for number in range(POSTS_PER_PAGE_NUMBER):
+            post = Post.objects.create(
+                text=f'Пост {number}',
+                author=self.user_author,
+                group=self.group
+            )
+            Comment.objects.create(
+                text='Текст комментария',
+                post=post,
+                author=self.user
+            )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.count_queries(url),
+                    single_post_queries[url]
+                )
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create(username=AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title='Тестовое название',
+            slug=SLUG,
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый текст поста',
+            author=cls.user_author,
+            group=cls.group
+        )
+        cls.guest_client = Client()
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user_author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        """Повторный запрос анонима обслуживается из кэша
+        без вызова представления.
+        """
+        for url in [INDEX_URL, POST_GROUP_URL, PROFILE_URL]:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIsNotNone(response.context)
+                cached_response = self.guest_client.get(url)
+                self.assertIsNone(cached_response.context)
+                self.assertEqual(response.content, cached_response.content)
+
+    def test_changes_purge_cached_pages(self):
+        """Изменение поста сбрасывает страницы с его тегами."""
+        urls = [INDEX_URL, POST_GROUP_URL, PROFILE_URL]
+        for url in urls:
+            self.guest_client.get(url)
+        self.post.text = 'Отредактированный текст'
+        self.post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIsNotNone(response.context)
+                self.assertContains(response, 'Отредактированный текст')
+
+    def test_group_and_author_changes_purge_post_cards(self):
+        """Переименование группы или автора и удаление группы
+        обновляют закэшированные карточки постов.
+        """
+        urls = [INDEX_URL, PROFILE_URL]
+        for url in urls:
+            self.guest_client.get(url)
+        group = Group.objects.get(id=self.group.id)
+        group.title = 'Новое название'
+        group.save()
+        author = User.objects.get(id=self.user_author.id)
+        author.username = 'renamed_author'
+        author.save()
+        for url in [INDEX_URL, reverse('profile', args=[author.username])]:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, '#Новое название')
+                self.assertContains(response, '@renamed_author')
+        group.delete()
+        for url in [INDEX_URL, reverse('profile', args=[author.username])]:
+            with self.subTest(url=url):
+                self.assertNotContains(self.guest_client.get(url),
+                                       '#Новое название')
+
+    def test_authorized_pages_are_not_cached(self):
+        """Страницы авторизованных пользователей не кэшируются целиком."""
+        self.authorized_client.get(INDEX_URL)
+        self.assertIsNotNone(self.authorized_client.get(INDEX_URL).context)
+
+    def test_pages_with_csrf_token_are_not_cached(self):
+        """Страница, выдавшая анониму CSRF-токен, не попадает в общий
+        кэш, хотя cookie токена добавляется уже после middleware.
+        """
+        for uses_token, view_calls in [(False, 1), (True, 2)]:
+            with self.subTest(uses_token=uses_token):
+                cache.clear()
+                requests = []
+
+                def view(request):
+                    requests.append(request)
+                    if uses_token:
+                        get_token(request)
+                    return set_surrogate_keys(HttpResponse(), 'posts')
+
+                middleware = AnonymousPageCacheMiddleware(view)
+                for _ in range(2):
+                    request = RequestFactory().get(INDEX_URL)
+                    request.user = AnonymousUser()
+                    request.resolver_match = resolve(INDEX_URL)
+                    if middleware.process_view(request, view, (), {}) is None:
+                        middleware(request)
+                self.assertEqual(len(requests), view_calls)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create(username=AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title='Тестовое название',
+            slug=SLUG,
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый текст поста',
+            author=cls.user_author,
+            group=cls.group
+        )
+        cls.urls = [
+            INDEX_URL,
+            POST_GROUP_URL,
+            PROFILE_URL,
+            reverse('post', args=[AUTHOR_USERNAME, cls.post.id]),
+        ]
+        cls.guest_client = Client()
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user_author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_pages_return_not_modified(self):
+        """Повторный запрос с валидаторами получает 304."""
+        for client in [self.guest_client, self.authorized_client]:
+            for url in self.urls:
+                with self.subTest(url=url):
+                    client.get(url)
+                    response = client.get(url)
+                    self.assertEqual(
+                        client.get(
+                            url, HTTP_IF_NONE_MATCH=response['ETag']
+                        ).status_code,
+                        304
+                    )
+                    self.assertEqual(
+                        client.get(
+                            url,
+                            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                        ).status_code,
+                        304
+                    )
+
+    def test_response_issuing_csrf_cookie_has_no_validators(self):
+        """Ответ, впервые выдающий CSRF-cookie, идёт без ETag,
+        следующие - с ним.
+        """
+        client = Client()
+        client.force_login(self.user_author)
+        url = reverse('post', args=[AUTHOR_USERNAME, self.post.id])
+        response = client.get(url)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertTrue(client.get(url).has_header('ETag'))
+
+    def test_etag_differs_between_users(self):
+        """ETag страницы зависит от пользователя."""
+        etag = self.guest_client.get(INDEX_URL)['ETag']
+        response = self.authorized_client.get(
+            INDEX_URL, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_invalidate_validators(self):
+        """После изменения поста страницы отдаются заново."""
+        etags = {url: self.guest_client.get(url)['ETag'] for url in self.urls}
+        Comment.objects.create(
+            text='Текст комментария',
+            post=self.post,
+            author=self.user_author
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+
+
+class CachedCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.group = Group.objects.create(
+            title='Тестовое название',
+            slug=SLUG,
+            description='Тестовое описание',
+        )
+        for number in range(POSTS_PER_PAGE_NUMBER + 3):
+            Post.objects.create(
+                text=f'Пост {number}', author=cls.user, group=cls.group
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url).context['page']
+            count = page.paginator.count
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'COUNT(' in query['sql'] and 'posts_post' in query['sql']
+        ])
+        return count
+
+    def test_feeds_do_not_count_posts(self):
+        """Ленты берут число постов из счётчиков, а не из COUNT(*)."""
+        for url in [INDEX_URL, POST_GROUP_URL,
+                    reverse('profile', args=[USERNAME])]:
+            with self.subTest(url=url):
+                self.assertEqual(self.get_page(url), Post.objects.count())
+
+    def test_group_count_follows_post_changes(self):
+        """Счётчик группы сдвигается при публикации, переносе
+        и удалении поста без пересчёта.
+        """
+        other = Group.objects.create(title='Другая группа', slug='other')
+        post = Post.objects.create(text='Новый пост', author=self.user,
+                                   group=self.group)
+        self.assertEqual(self.get_page(POST_GROUP_URL),
+                         self.group.posts.count())
+        post.group = other
+        post.save()
+        other_url = reverse('group_posts', args=[other.slug])
+        self.assertEqual(self.get_page(other_url), 1)
+        post.delete()
+        self.assertEqual(self.get_page(other_url), 0)
+        self.assertEqual(self.get_page(POST_GROUP_URL),
+                         self.group.posts.count())
+
+
+class RenderPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username=USERNAME)
+        cls.group = Group.objects.create(
+            title='Тестовое название',
+            slug=SLUG,
+            description='Тестовое описание',
+        )
+        for number in range(3):
+            Post.objects.create(
+                text=f'Пост {number}\n<b>', author=cls.user, group=cls.group
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, source):
+        cache.clear()
+        return engines['django'].engine.from_string(source).render(Context({
+            'posts': Post.objects.for_feed(),
+            'feed_cache_timeout': 60,
+        }))
+
+    def test_render_posts_matches_include(self):
+        """{% render_posts %} даёт ту же разметку, что и {% include %}
+        в цикле, и передаёт параметры шаблону поста.
+        """
+        for options in ['', ' hide_post_group=True']:
+            with self.subTest(options=options):
+                self.assertHTMLEqual(
+                    self.render('{% load posts_feed %}'
+                                '{% render_posts posts' + options + ' %}'),
+                    self.render('{% for post in posts %}'
+                                '{% include "post_item.html" with post=post'
+                                + options + ' %}{% endfor %}')
+                )
+
+    def test_post_card_follows_author_and_group_versions(self):
+        """Ключ карточки поста зависит от версий автора и группы."""
+        source = '{% load posts_feed %}{% render_posts posts %}'
+        self.render(source)
+        for tag, model, obj, field in [
+            (make_tag('group', SLUG), Group, self.group, 'title'),
+            (make_tag('author', self.user.id), User, self.user, 'username'),
+        ]:
+            with self.subTest(tag=tag):
+                model.objects.filter(id=obj.id).update(**{field: 'renamed'})
+                bump_tags(tag)
+                rendered = engines['django'].engine.from_string(
+                    source
+                ).render(Context({
+                    'posts': Post.objects.for_feed(),
+                    'feed_cache_timeout': 60,
+                }))
+                self.assertIn(
+                    '#renamed' if model is Group else '@renamed', rendered
+                )
+
+    def test_benchmark_templates(self):
+        output = StringIO()
+        call_command('benchmark_templates', repeat=1, stdout=output)
+        self.assertIn('render_posts', output.getvalue())
@@ -0,0 +1,55 @@
+import re
+from contextlib import contextmanager
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts import tasks
+
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?\w+$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def bad_plan_steps(sql):
+    """Шаги плана с полным сканированием таблицы или сортировкой
+    во временном B-дереве."""
+    return [step for step in query_plan(sql)
+            if FULL_SCAN.search(step) or TEMP_SORT in step]
+
+
+def assert_feed_uses_indexes(testcase, client, url, data=None):
+    """Запрашивает страницу и проверяет план каждого SELECT
+    к таблицам posts_*: лента должна читаться по индексам.
+
+    Работает только на SQLite: EXPLAIN QUERY PLAN - его синтаксис.
+    """
+    if connection.vendor != 'sqlite':
+        testcase.skipTest('EXPLAIN QUERY PLAN поддерживается только SQLite')
+    with CaptureQueriesContext(connection) as context:
+        client.get(url, data)
+    feed_queries = [query['sql'] for query in context.captured_queries
+                    if query['sql'].startswith('SELECT')
+                    and '"posts_' in query['sql']]
+    testcase.assertTrue(feed_queries)
+    for sql in feed_queries:
+        with testcase.subTest(url=url, sql=sql):
+            testcase.assertEqual(bad_plan_steps(sql), [])
+
+
+@contextmanager
+def eager_tasks():
+    """Выполняет задачи posts.tasks.enqueue сразу, в текущем потоке
+    и транзакции теста: в TestCase колбэки on_commit не вызываются.
+    """
+    with mock.patch.object(tasks.transaction, 'on_commit',
+                           lambda callback: callback()), \
+            mock.patch.object(tasks.executor, 'submit',
+                              lambda run_task, func, *args: func(*args)):
+        yield
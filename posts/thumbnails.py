@@ -0,0 +1,224 @@
+import logging
+
+from django.core.cache import cache
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .cache import bump_tags
+from .images import make_placeholder
+from .models import Post
+from .resize import make_spec, parse_spec, resized_url
+from .settings import POST_IMAGE_FORMATS, POST_THUMBNAILS
+from .signals import post_tags
+from .tasks import enqueue
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'thumbnails_pending:{}'
+PENDING_TIMEOUT = 60
+
+
+def generate_placeholder(source):
+    """Заполняет image_placeholder постов с изображением source,
+    у которых его ещё нет. Возвращает True, если посты изменились.
+    """
+    posts = Post.objects.filter(image=source.name, image_placeholder='')
+    if not posts.exists():
+        return False
+    try:
+        with source.storage.open(source.name) as file_:
+            placeholder = make_placeholder(file_)
+    except OSError:
+        logger.warning('Не удалось создать заглушку для %s', source.name)
+        return False
+    return bool(posts.update(image_placeholder=placeholder))
+
+
+def generate_thumbnails(name):
+    """Создаёт недостающие миниатюры POST_THUMBNAILS и заглушку
+    для изображения name.
+
+    Если появилось что-то новое, сбрасывает кэш постов с этим
+    изображением: их разметка ссылалась на оригинал.
+    """
+    backend = DeferredThumbnailBackend()
+    source = ImageFile(name, Post._meta.get_field('image').storage)
+    created = 0
+    for geometry, options in POST_THUMBNAILS:
+        if backend.get_ready_thumbnail(source, geometry, **options):
+            continue
+        thumbnail = backend.create_thumbnail(source, geometry, **options)
+        if default.kvstore.get(thumbnail) is not None:
+            created += 1
+    created += generate_placeholder(source)
+    cache.delete(PENDING_KEY.format(name))
+    if not created:
+        return
+    posts = Post.objects.filter(image=name).values_list(
+        'id', 'author', 'group'
+    )
+    tags = set()
+    for post_id, author_id, group_id in posts:
+        tags.update(post_tags(post_id, author_id, [group_id]))
+    bump_tags(*tags)
+
+
+def enqueue_thumbnails(post):
+    if post.image and cache.add(PENDING_KEY.format(post.image.name), True,
+                                PENDING_TIMEOUT):
+        enqueue(generate_thumbnails, post.image.name)
+
+
+def get_raw_many(keys):
+    """Сырые значения хранилища ключей sorl одним запросом к кэшу
+    и одним к базе; отсутствующие ключи запоминаются в кэше, как это
+    делает сам sorl.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing
+        ).values_list('key', 'value'))
+        found.update(
+            (key, EMPTY_VALUE) for key in missing if key not in found
+        )
+        kvstore.cache.set_many(
+            found, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(found)
+    return {key: None if value == EMPTY_VALUE else value
+            for key, value in values.items()}
+
+
+def image_sources(image, variants):
+    """Источники <picture> из готовых вариантов изображения:
+    по одному srcset на формат, от узких вариантов к широким.
+    """
+    sources = []
+    for image_format in POST_IMAGE_FORMATS:
+        ready = sorted(
+            filter(None, (image.prefetched_thumbnails.get(key)
+                          for variant_format, key in variants
+                          if variant_format == image_format)),
+            key=lambda thumbnail: thumbnail.width
+        )
+        if ready:
+            sources.append({
+                'type': f'image/{image_format.lower()}',
+                'srcset': ', '.join(f'{thumbnail.url} {thumbnail.width}w'
+                                    for thumbnail in ready),
+            })
+    return sources
+
+
+def prefetch_thumbnails(posts):
+    """Загружает сведения о миниатюрах всех постов страницы разом.
+
+    Результат прикрепляется к post.image, и {% thumbnail %} в шаблоне
+    поста больше не обращается к хранилищу ключей. В post.image_sources
+    попадают готовые варианты изображения для разметки <picture>.
+    """
+    backend = DeferredThumbnailBackend()
+    wanted = {}
+    variants = {}
+    for post in posts:
+        post.image_sources = []
+        if not post.image:
+            continue
+        post.image.prefetched_thumbnails = {}
+        for geometry, options in POST_THUMBNAILS:
+            key = backend.thumbnail_file(
+                post.image, geometry, dict(options)
+            ).key
+            wanted.setdefault(add_prefix(key), []).append((post.image, key))
+            variants.setdefault(post, []).append((options['format'], key))
+    if not wanted:
+        return
+    for raw_key, value in get_raw_many(list(wanted)).items():
+        thumbnail = deserialize_image_file(value) if value else None
+        for image, key in wanted[raw_key]:
+            image.prefetched_thumbnails[key] = thumbnail
+    for post, post_variants in variants.items():
+        post.image_sources = image_sources(post.image, post_variants)
+
+
+class ResizedImage:
+    """Вариант изображения, который отдаёт представление resized_image."""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.url = resized_url(name, spec)
+
+
+class DeferredThumbnailBackend(ThumbnailBackend):
+    """Бэкенд для шаблонов: отдаёт только готовые миниатюры.
+
+    Если миниатюры ещё нет, её создание ставится в очередь, а шаблон
+    получает подписанный адрес resized_image (или оригинал, если
+    геометрию нельзя туда передать) - кодирование изображений никогда
+    не выполняется во время отрисовки страницы.
+    """
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        """Файл миниатюры: имя вычисляется так же, как в sorl."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра или None.
+
+        Сначала смотрит в результаты prefetch_thumbnails, затем
+        в хранилище ключей sorl.
+        """
+        thumbnail = self.thumbnail_file(file_, geometry_string, options)
+        prefetched = getattr(file_, 'prefetched_thumbnails', None)
+        if prefetched is not None and thumbnail.key in prefetched:
+            return prefetched[thumbnail.key]
+        return default.kvstore.get(thumbnail)
+
+    def create_thumbnail(self, file_, geometry_string, **options):
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        thumbnail = self.get_ready_thumbnail(
+            file_, geometry_string, **options
+        )
+        if thumbnail:
+            return thumbnail
+        source = ImageFile(file_)
+        if cache.add(PENDING_KEY.format(source.name), True,
+                     PENDING_TIMEOUT):
+            logger.info('Миниатюра %s для %s поставлена в очередь',
+                        geometry_string, source.name)
+            enqueue(generate_thumbnails, source.name)
+        spec = make_spec(
+            geometry_string,
+            options.get('crop'),
+            options.get('format', thumbnail_settings.THUMBNAIL_FORMAT)
+        )
+        if parse_spec(spec) is None:
+            return source
+        return ResizedImage(source.name, spec)
@@ -0,0 +1,204 @@
+import random
+from functools import partial
+
+from django.core.cache import cache
+from django.db.models import Q, Sum
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .pagination import paginate
+from .settings import FANOUT_MAX_FOLLOWERS, TIMELINE_MAX_LENGTH
+from .tasks import enqueue
+
+TRIM_CHUNK_SIZE = 1000
+# Раскладка добавляет в ленту одну запись, поэтому после неё
+# проверяется в среднем одна лента из TRIM_SAMPLE_RATE: ленты
+# переполняются в среднем не больше чем на столько записей
+TRIM_SAMPLE_RATE = 20
+BACKFILL_KEY = 'timeline_backfill:{}'
+BACKFILL_LOCK_TIMEOUT = 60 * 60
+
+
+def is_pull_author(author_id):
+    return UserStats.objects.filter(
+        user=author_id,
+        followers_count__gt=FANOUT_MAX_FOLLOWERS
+    ).exists()
+
+
+def trim_timelines(users):
+    """Оставляет в лентах читателей не больше TIMELINE_MAX_LENGTH записей.
+
+    Для каждой ленты одним запросом по индексу (user, -pub_date, -post)
+    читается запись сразу за границей; если её нет, лента
+    не переполнена и ничего не удаляется.
+    """
+    for user_id in users:
+        overflow = TimelineEntry.objects.filter(user=user_id).order_by(
+            '-pub_date', '-post'
+        ).values_list('pub_date', 'post')[
+            TIMELINE_MAX_LENGTH:TIMELINE_MAX_LENGTH + 1
+        ]
+        for pub_date, post_id in overflow:
+            TimelineEntry.objects.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, post__lte=post_id),
+                user=user_id
+            ).delete()
+
+
+def fan_out_post(post_id):
+    """Раскладывает новый пост по лентам подписчиков автора.
+
+    Посты авторов с очень большим числом подписчиков не раскладываются:
+    лента подмешивает их при чтении (см. timeline_posts).
+    """
+    post = Post.objects.filter(id=post_id).values(
+        'author', 'pub_date'
+    ).first()
+    if post is None or is_pull_author(post['author']):
+        return
+    followers = list(Follow.objects.filter(
+        author=post['author']
+    ).values_list('user', flat=True))
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id,
+                       pub_date=post['pub_date'])
+         for user_id in followers),
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+    trim_timelines(user_id for user_id in followers
+                   if random.randrange(TRIM_SAMPLE_RATE) == 0)
+
+
+def enqueue_fan_out(post):
+    enqueue(fan_out_post, post.id)
+
+
+def recent_posts(author_id):
+    return list(Post.objects.filter(author=author_id).order_by(
+        '-pub_date'
+    ).values_list('id', 'pub_date')[:TIMELINE_MAX_LENGTH])
+
+
+def backfill_timeline(user_id, author_id):
+    if is_pull_author(author_id):
+        return
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in recent_posts(author_id)),
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+    trim_timelines([user_id])
+
+
+def backfill_followers(author_id):
+    """Раскладывает последние посты автора по лентам всех подписчиков.
+
+    Нужна, когда автор возвращается из pull-режима: его посты того
+    времени и ленты подписавшихся тогда читателей не заполнялись.
+    """
+    cache.delete(BACKFILL_KEY.format(author_id))
+    if is_pull_author(author_id):
+        return
+    posts = recent_posts(author_id)
+    followers = Follow.objects.filter(author=author_id).order_by(
+        'user'
+    ).values_list('user', flat=True)
+    last_user_id = 0
+    while True:
+        users = list(
+            followers.filter(user__gt=last_user_id)[:TRIM_CHUNK_SIZE]
+        )
+        if not users:
+            break
+        last_user_id = users[-1]
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for user_id in users for post_id, pub_date in posts),
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+        trim_timelines(users)
+
+
+def followers_changed(author_id, previous, current):
+    """Ставит в очередь заполнение лент подписчиков, если с изменением
+    числа подписчиков с previous до current автор вышел из pull-режима.
+    """
+    if previous > FANOUT_MAX_FOLLOWERS >= current and cache.add(
+        BACKFILL_KEY.format(author_id), True, BACKFILL_LOCK_TIMEOUT
+    ):
+        enqueue(backfill_followers, author_id)
+
+
+def drop_from_timeline(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user=user_id,
+        post__author=author_id
+    ).delete()
+
+
+def pulled_authors(user):
+    return list(
+        UserStats.objects.filter(
+            user__following__user=user,
+            followers_count__gt=FANOUT_MAX_FOLLOWERS
+        ).values_list('user', flat=True)
+    )
+
+
+def timeline_posts(user, pulled=None):
+    """Посты ленты подписок: чтение материализованной ленты
+    плюс посты авторов, которые работают в pull-режиме.
+
+    pulled - уже найденные pull-авторы подписок user.
+    """
+    if pulled is None:
+        pulled = pulled_authors(user)
+    if not pulled:
+        return Post.objects.filter(timeline_entries__user=user)
+    return Post.objects.filter(
+        Q(id__in=TimelineEntry.objects.filter(user=user).values('post'))
+        | Q(author__in=pulled)
+    )
+
+
+def timeline_count(user, pulled):
+    """Число постов ленты подписок без COUNT(*) по объединению.
+
+    Материализованная лента ограничена TIMELINE_MAX_LENGTH и считается
+    по индексу, посты pull-авторов берутся из их статистики - это
+    оценка сверху: их посты могут уже лежать в ленте.
+    """
+    count = TimelineEntry.objects.filter(user=user).count()
+    if pulled:
+        count += UserStats.objects.filter(user__in=pulled).aggregate(
+            total=Sum('posts_count')
+        )['total'] or 0
+    return count
+
+
+def timeline_page(request, user):
+    """Страница ленты подписок.
+
+    Без pull-авторов страница читается прямо из индекса
+    (user, -pub_date, -post) материализованной ленты.
+    """
+    pulled = pulled_authors(user)
+    count = partial(timeline_count, user, pulled)
+    if pulled:
+        return paginate(request, timeline_posts(user, pulled).for_feed(),
+                        count=count)
+    page = paginate(
+        request,
+        TimelineEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group'
+        ),
+        id_field='post_id',
+        count=count
+    )
+    page.object_list = [entry.post for entry in page.object_list]
+    return page
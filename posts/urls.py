@@ -7,6 +7,9 @@ urlpatterns = [
     path('new/',
          views.new_post,
          name='new_post'),
+    path('resize/<str:signature>/<str:spec>/<path:name>',
+         views.resized_image,
+         name='resized_image'),
     path('group/<slug:slug>/',
          views.group_posts,
          name='group_posts'),
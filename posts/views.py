@@ -1,40 +1,71 @@
-from django.core.paginator import Paginator
+from functools import partial
+
 from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404, redirect, render
 
+from .cache import make_tag, tagged_page
 from .forms import CommentForm, PostForm
+from .markup import enqueue_rerender
 from .models import Follow, Group, Post, User
+from .pagination import CountedPaginator, paginate
+from .resize import check_signature, get_resized, parse_spec
 from .settings import POSTS_PER_PAGE_NUMBER
+from .stats import (
+    author_post_count, get_stats, group_post_count, index_post_count
+)
+from .thumbnails import enqueue_thumbnails, prefetch_thumbnails
+from .timeline import timeline_page
+
+
+def profile_tags(username):
+    author_id = User.objects.filter(
+        username=username
+    ).values_list('id', flat=True).first()
+    return [make_tag('author', author_id)] if author_id else []
 
 
+def post_view_tags(username, post_id):
+    author_id = Post.objects.filter(
+        id=post_id, author__username=username
+    ).order_by('id').values_list('author_id', flat=True).first()
+    if author_id is None:
+        return []
+    return [make_tag('post', post_id), make_tag('author', author_id)]
+
+
+@tagged_page(lambda: ['posts'])
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE_NUMBER)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = paginate(request, Post.objects.for_feed(),
+                    count=index_post_count)
+    prefetch_thumbnails(page)
+    enqueue_rerender(page)
     return render(request, 'index.html', {
         'page': page
     })
 
 
+@tagged_page(lambda slug: [make_tag('group', slug)])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE_NUMBER)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = paginate(request, group.posts.for_feed(),
+                    count=partial(group_post_count, group))
+    prefetch_thumbnails(page)
+    enqueue_rerender(page)
     return render(request, 'group.html', {
         'group': group,
         'page': page
     })
 
 
+@tagged_page(profile_tags)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE_NUMBER)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    page = paginate(request, author.posts.for_feed(),
+                    count=partial(author_post_count, author))
+    prefetch_thumbnails(page)
+    enqueue_rerender(page)
     following = (
         request.user.is_authenticated
         and request.user != author
@@ -45,15 +76,20 @@ def profile(request, username):
     return render(request, 'profile.html', {
         'page': page,
         'author': author,
+        'author_stats': get_stats(author),
         'following': following
     })
 
 
+@tagged_page(post_view_tags)
 def post_view(request, username, post_id):
     form = CommentForm()
-    post = get_object_or_404(Post,
-                             id=post_id,
-                             author__username=username)
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related('author__stats'),
+        id=post_id,
+        author__username=username
+    )
+    prefetch_thumbnails([post])
     following = (
         request.user.is_authenticated
         and request.user != post.author
@@ -61,13 +97,16 @@ def post_view(request, username, post_id):
             author=post.author, user=request.user
         ).exists()
     )
-    comment_list = post.comments.all()
-    paginator = Paginator(comment_list, POSTS_PER_PAGE_NUMBER)
+    comment_list = post.comments.select_related('author')
+    paginator = CountedPaginator(comment_list, POSTS_PER_PAGE_NUMBER,
+                                 count=post.comment_count)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
+    enqueue_rerender([post, *page])
     return render(request, 'post.html', {
         'post': post,
         'author': post.author,
+        'author_stats': get_stats(post.author),
         'form': form,
         'page': page,
         'comments': comment_list,
@@ -103,6 +142,7 @@ def new_post(request):
     new_post = form.save(commit=False)
     new_post.author = request.user
     new_post.save()
+    enqueue_thumbnails(new_post)
     return redirect('index')
 
 
@@ -125,7 +165,14 @@ def post_edit(request, username, post_id):
             'form': form,
             'post': post
         })
-    form.save()
+    post = form.save(commit=False)
+    update_fields = list(form._meta.fields)
+    if 'image' in form.changed_data:
+        post.image_placeholder = ''
+        update_fields.append('image_placeholder')
+    post.save(update_fields=update_fields)
+    if 'image' in form.changed_data:
+        enqueue_thumbnails(post)
     return redirect('post',
                     username,
                     post_id)
@@ -133,10 +180,9 @@ def post_edit(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, POSTS_PER_PAGE_NUMBER)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = timeline_page(request, request.user)
+    prefetch_thumbnails(page)
+    enqueue_rerender(page)
     return render(request, 'follow.html', {
         'page': page})
 
@@ -162,6 +208,22 @@ def profile_unfollow(request, username):
                     username=username)
 
 
+def resized_image(request, signature, spec, name):
+    """Вариант изображения поста по подписанной спецификации."""
+    parsed = parse_spec(spec)
+    if parsed is None or not check_signature(signature, spec, name):
+        raise Http404
+    try:
+        path = get_resized(spec, name)
+    except OSError:
+        raise Http404
+    response = FileResponse(
+        open(path, 'rb'), content_type=f'image/{parsed[3].lower()}'
+    )
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 def page_not_found(request, exception):
     return render(request,
                   'misc/404.html',
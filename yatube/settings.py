@@ -58,7 +58,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware'
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware'
 ]
 
 INTERNAL_IPS = [
@@ -79,7 +80,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'users.context_processors.year'
+                'users.context_processors.year',
+                'posts.context_processors.feed_cache'
             ],
         },
     },
@@ -148,6 +150,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Шаблоны не создают миниатюры сами: это делает фоновая задача
+THUMBNAIL_BACKEND = 'posts.thumbnails.DeferredThumbnailBackend'
+
 # Login
 
 LOGIN_URL = "/auth/login/"